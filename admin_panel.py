@@ -0,0 +1,132 @@
+"""
+Panel de administración en la barra lateral: métricas de las peticiones a
+Notion y trazas de las últimas ejecuciones
+
+Se muestra con NOTION_ADMIN=1, o abriendo la app con ?admin=<NOTION_ADMIN_KEY>.
+Con NOTION_METRICS_PORT se sirven además las métricas en /metrics para Prometheus.
+"""
+import os
+
+import pandas as pd
+import streamlit as st
+
+from metrics import percentile, request_metrics, serve_metrics
+from tracing import TRACING_ENABLED, read_traces
+
+
+ADMIN_ENABLED = os.getenv("NOTION_ADMIN", "0") == "1"
+ADMIN_KEY = os.getenv("NOTION_ADMIN_KEY")
+METRICS_PORT = os.getenv("NOTION_METRICS_PORT")
+
+
+def admin_enabled():
+    """Indica si hay que mostrar el panel en esta sesión"""
+    if ADMIN_ENABLED:
+        return True
+    return bool(ADMIN_KEY) and st.query_params.get("admin") == ADMIN_KEY
+
+
+@st.cache_resource(show_spinner=False)
+def start_metrics_server():
+    """Arranca (una vez por proceso) el servidor de /metrics si hay puerto configurado"""
+    if not METRICS_PORT:
+        return None
+    return serve_metrics(int(METRICS_PORT))
+
+
+def render_admin_sidebar():
+    """Tabla de peticiones por endpoint y función, con exportación a Prometheus"""
+    with st.sidebar:
+        st.header("🛠️ Administración")
+        st.subheader("Peticiones a Notion")
+
+        rows = request_metrics.summary()
+        if not rows:
+            st.caption("Todavía no se ha hecho ninguna petición")
+        else:
+            total_calls = sum(row["calls"] for row in rows)
+            total_errors = sum(row["errors"] for row in rows)
+            total_throttled = sum(row["throttled"] for row in rows)
+
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Peticiones", total_calls)
+            col2.metric("Errores", total_errors)
+            col3.metric("429", total_throttled)
+
+            st.dataframe(
+                pd.DataFrame(rows).rename(columns={
+                    "endpoint": "Endpoint",
+                    "caller": "Función",
+                    "calls": "Peticiones",
+                    "errors": "Errores",
+                    "throttled": "429",
+                    "kb": "KB",
+                    "kb_per_call": "KB/petición",
+                }),
+                hide_index=True,
+                use_container_width=True
+            )
+            st.caption("p50/p95/p99: latencia (ms) de las últimas peticiones de cada endpoint")
+
+        st.download_button(
+            "📥 Exportar (Prometheus)",
+            request_metrics.prometheus_text(),
+            file_name="notion_metrics.prom",
+            mime="text/plain",
+            use_container_width=True
+        )
+
+        if st.button("Reiniciar métricas", use_container_width=True):
+            request_metrics.reset()
+            st.rerun()
+
+        render_traces()
+
+
+def render_traces(limit=200):
+    """Fases más lentas y últimas ejecuciones, a partir de las trazas guardadas"""
+    st.subheader("Trazas de ejecución")
+    if not TRACING_ENABLED:
+        st.caption("Las trazas están desactivadas (NOTION_TRACING=0)")
+        return
+
+    traces = read_traces(limit)
+    if not traces:
+        st.caption("Todavía no hay trazas")
+        return
+
+    # Duración de cada fase en las últimas ejecuciones
+    durations = {}
+    for trace in traces:
+        durations.setdefault(f"({trace['name']})", []).append(trace["duration_ms"])
+        for trace_span in trace["spans"]:
+            durations.setdefault(trace_span["name"], []).append(trace_span["duration_ms"])
+
+    phases = []
+    for name, values in durations.items():
+        values.sort()
+        phases.append({
+            "Fase": name,
+            "Veces": len(values),
+            "p50_ms": percentile(values, 0.50),
+            "p95_ms": percentile(values, 0.95),
+            "máx_ms": values[-1],
+        })
+    phases.sort(key=lambda row: row["p95_ms"], reverse=True)
+    st.dataframe(pd.DataFrame(phases), hide_index=True, use_container_width=True)
+    st.caption(f"Últimas {len(traces)} ejecuciones; entre paréntesis, la ejecución completa")
+
+    with st.expander("Últimas ejecuciones"):
+        recent = []
+        for trace in reversed(traces[-30:]):
+            slowest = max(trace["spans"], key=lambda item: item["duration_ms"], default=None)
+            recent.append({
+                "Hora": trace["ts"][11:19],
+                "Sesión": (trace["session"] or "")[:8],
+                "Ejecución": trace["name"],
+                "Provocada por": ", ".join(trace["trigger"]) or "-",
+                "ms": trace["duration_ms"],
+                "Fase más lenta": f"{slowest['name']} ({slowest['duration_ms']} ms)" if slowest else "-",
+                "Estado": trace["status"],
+            })
+        st.dataframe(pd.DataFrame(recent), hide_index=True, use_container_width=True)
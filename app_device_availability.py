@@ -1,8 +1,23 @@
 import streamlit as st
-import requests
-from datetime import datetime, date
 import os
-from dotenv import load_dotenv
+import pandas as pd
+import requests
+import threading
+import time
+import unicodedata
+from datetime import date, datetime, timezone
+
+from admin_panel import admin_enabled, render_admin_sidebar, start_metrics_server
+from assignment import fetch_pages
+from assignment_jobs import AssignmentJournal, cancel_job, resume_job, retry_failed, rollback_job, run_job
+from availability import AvailabilityIndex
+from notion_api import NotionAPIError, QueryPage, complete_page, get_all_pages, notion_request, query_database, set_projection
+from notion_filters import availability_filter
+from notion_mirror import MIRROR_ENABLED, get_mirror
+from notion_schema import extract_device_fields, extract_location_fields, property_names
+from records import NO_NAME, NO_TAG, DeviceCatalog, Location, device_from_page, with_location
+from selection import SelectionModel
+from tracing import add_time, begin_run, end_run, span, traced_fragment
 
 
 # Configuración de la página
@@ -12,6 +27,9 @@ st.set_page_config(
     layout="centered"
 )
 
+# Traza de esta ejecución: duración de cada fase (se guarda al final del script)
+begin_run("app")
+
 # Logo + título en la misma línea (alineados a la izquierda)
 logo_col, title_col = st.columns([1, 9])
 
@@ -25,143 +43,290 @@ with title_col:
 st.markdown("Consulta qué dispositivos están disponibles para alquilar en un rango de fechas")
 st.markdown("---")
 
-# Cargar variables de entorno desde el archivo .env
-load_dotenv()
-
 # Configuración de Notion
-NOTION_TOKEN = os.getenv("NOTION_TOKEN")
-NOTION_VERSION = "2022-06-28"
 DEVICES_ID = "43e15b677c8c4bd599d7c602f281f1da"
 LOCATIONS_ID = "28758a35e4118045abe6e37534c44974"
 
-headers = {
-    "Authorization": f"Bearer {NOTION_TOKEN}",
-    "Content-Type": "application/json",
-    "Notion-Version": NOTION_VERSION,
-}
+# Sólo se piden a Notion las propiedades que leen los extractores
+set_projection(DEVICES_ID, property_names(extract_device_fields))
+set_projection(LOCATIONS_ID, property_names(extract_location_fields))
 
+# Segundos que se reutilizan los datos leídos de Notion entre consultas
+CACHE_TTL = int(os.getenv("NOTION_CACHE_TTL", "300"))
 
-def get_pages(database_id):
-    """Obtiene todas las páginas de una base de datos de Notion"""
-    url = f"https://api.notion.com/v1/databases/{database_id}/query"
-    payload = {"page_size": 100}
+# Sin copia local, Notion hace un primer descarte por fechas (NOTION_PREFILTER=0 lo desactiva)
+PREFILTER_ENABLED = os.getenv("NOTION_PREFILTER", "1") != "0"
+
+# Tras asignar, segundos hasta releer de Notion lo asignado (Notion tarda un
+# poco en ver los cambios en las consultas) y cuántas veces se intenta
+RECONCILE_DELAY = float(os.getenv("NOTION_RECONCILE_DELAY", "5"))
+RECONCILE_ATTEMPTS = 3
+
+# Diario de las asignaciones en bloque (para reanudarlas o deshacerlas)
+journal = AssignmentJournal()
+
+# Dispositivos por página en la lista de resultados
+PAGE_SIZE = int(os.getenv("DEVICE_PAGE_SIZE", "50"))
+PAGE_SIZE_OPTIONS = sorted({25, 50, 100, 200, PAGE_SIZE})
+
+
+def iter_pages(database_id):
+    """
+    Devuelve las páginas de una base de datos en bloques (QueryPage)
+
+    Con la copia local activa, primero trae de Notion sólo los cambios y
+    luego devuelve todas las páginas desde SQLite en un único bloque.
+    Sin ella, devuelve los bloques de Notion según van llegando.
+    """
+    if not MIRROR_ENABLED:
+        yield from query_database(database_id)
+        return
+    
+    # Los rollups de fechas de Devices salen de Locations
+    depends_on = (LOCATIONS_ID,) if database_id == DEVICES_ID else ()
     
-    response = requests.post(url, json=payload, headers=headers)
-    data = response.json()
+    started = time.perf_counter()
+    mirror = get_mirror()
+    mirror.sync(database_id, depends_on=depends_on)
+    pages = mirror.pages(database_id)
     
-    return data.get("results", [])
+    yield QueryPage(pages, 0, time.perf_counter() - started, False)
+
+
+def get_pages(database_id):
+    """Obtiene todas las páginas de una base de datos de Notion (sigue la paginación)"""
+    pages = []
+    for batch in iter_pages(database_id):
+        pages.extend(batch.results)
+    return pages
 
 
 def extract_device_data(page):
-    """Extrae los campos específicos de cada dispositivo"""
-    props = page["properties"]
-    device_data = {}
-    
-    # Extraer ID de la página
-    device_data["id"] = page["id"]
-    
-    # Extraer Name
+    """
+    Extrae los campos específicos de cada dispositivo (fechas ya convertidas a date)
+
+    Si la página trae la relación cortada (más de 25 reservas) se completa
+    antes, o se perderían reservas. Si no se puede, se queda con las que trae:
+    antes de escribir se vuelve a leer (revalidate_selection).
+    """
     try:
-        if props.get("Name") and props["Name"]["title"]:
-            device_data["Name"] = props["Name"]["title"][0]["text"]["content"]
+        page = complete_page(page)
+    except (NotionAPIError, requests.RequestException):
+        pass
+    return device_from_page(page)
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def load_devices():
+    """Descarga y extrae todos los dispositivos (caché compartida por todas las sesiones)"""
+    devices = []
+    # Extraemos cada bloque en cuanto llega, sin esperar al último
+    for batch in iter_pages(DEVICES_ID):
+        add_time("fetch", batch.elapsed)
+        with span("extract"):
+            devices.extend(extract_device_data(page) for page in batch.results)
+    return devices
+
+
+@st.cache_resource(ttl=CACHE_TTL, show_spinner=False)
+def load_catalog():
+    """Índice de dispositivos por id y por nombre (una vez por cada descarga)"""
+    return DeviceCatalog(load_devices())
+
+
+@st.cache_resource(ttl=CACHE_TTL, show_spinner=False)
+def load_availability_index():
+    """Construye el índice de disponibilidad una vez por cada descarga de dispositivos"""
+    return AvailabilityIndex(load_catalog().devices)
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def load_candidates(start_date, end_date):
+    """Dispositivos que pueden estar libres en el rango según el filtro de Notion"""
+    devices = []
+    for batch in query_database(DEVICES_ID, filter=availability_filter(start_date, end_date)):
+        add_time("fetch", batch.elapsed)
+        with span("extract"):
+            devices.extend(extract_device_data(page) for page in batch.results)
+    return devices
+
+
+@st.cache_resource(show_spinner=False)
+def prefilter_state():
+    """Estado compartido: si Notion ha rechazado el filtro ya no se vuelve a intentar"""
+    return {"rejected": False}
+
+
+def find_available_devices(start_date, end_date):
+    """
+    Devuelve (catálogo, dispositivos libres en el rango)
+
+    Con la copia local se consulta el índice de todos los dispositivos. Sin
+    ella, Notion descarta primero los que seguro están ocupados y aquí se
+    comprueba cada candidato con check_availability. Si Notion rechaza el
+    filtro (400, p. ej. si los rollups no son "show original") se descarga
+    todo como antes.
+    """
+    state = prefilter_state()
+    if PREFILTER_ENABLED and not MIRROR_ENABLED and not state["rejected"]:
+        try:
+            with span("load_data"):
+                candidates = load_candidates(start_date, end_date)
+        except NotionAPIError as error:
+            if error.status_code != 400:
+                raise
+            state["rejected"] = True
         else:
-            device_data["Name"] = "Sin nombre"
-    except:
-        device_data["Name"] = "Sin nombre"
+            with span("availability"):
+                available_devices = [
+                    device for device in candidates
+                    if check_availability(device, start_date, end_date)
+                ]
+            return DeviceCatalog(candidates), available_devices
     
-    # ========================================
-    # 🔹 CORREGIDO: Extraer Tags (campo SELECT, no multi_select)
-    # ========================================
-    # Tags es un campo "select" que contiene UN SOLO VALOR
-    # Ejemplo: "Ultra" o "Neo 4"
-    try:
-        if props.get("Tags") and props["Tags"]["select"]:
-            # Extraemos el nombre del tag seleccionado
-            device_data["Tags"] = props["Tags"]["select"]["name"]
-        else:
-            device_data["Tags"] = "Sin tag"
-    except:
-        device_data["Tags"] = "Sin tag"
-    # ========================================
+    with span("load_data"):
+        catalog = load_catalog()
+        availability_index = load_availability_index()
     
-    # Extraer Locations_demo
-    try:
-        if props.get("Location") and props["Location"]["relation"]:
-            location_ids = [rel["id"] for rel in props["Location"]["relation"]]
-            device_data["Locations_demo_count"] = len(location_ids)
-        else:
-            device_data["Locations_demo_count"] = 0
-    except:
-        device_data["Locations_demo_count"] = 0
+    # Mismas reglas que check_availability
+    with span("availability"):
+        available_devices = availability_index.available(start_date, end_date)
+    return catalog, available_devices
+
+
+def invalidate_cache():
+    """Vacía la caché de dispositivos y ubicaciones tras escribir en Notion"""
+    load_devices.clear()
+    load_candidates.clear()
+    load_catalog.clear()
+    load_availability_index.clear()
+    get_in_house_locations.clear()
+
+
+def update_catalog(devices, catalog):
+    """Pone en el catálogo la versión nueva de los dispositivos; lo descargado antes deja de valer"""
+    if catalog.update(devices):
+        load_availability_index.clear()
+        load_devices.clear()
+        load_candidates.clear()
+
+
+def revalidate_selection(device_ids, catalog):
+    """
+    Antes de escribir nada: relee de Notion los seleccionados y comprueba que siguen libres
+
+    Entre la consulta y la asignación otro coordinador puede haber reservado
+    alguno. Se leen sólo esas páginas (GET por id, en paralelo), nunca la
+    base de datos entera: con el prefiltro el catálogo sólo tiene los
+    candidatos de las fechas, así que no sirve para saber cuánto costaría. Si
+    alguno ya no está libre en las fechas consultadas, o no se ha podido leer,
+    se quita de la selección, se avisa y se vuelve a pintar la página sin
+    asignar nada (esta función no vuelve).
+    """
+    device_ids = list(device_ids)
+    query_start = st.session_state.query_start_date
+    query_end = st.session_state.query_end_date
     
-    # Extraer Start Date
-    try:
-        if props.get("Start Date") and props["Start Date"]["rollup"]:
-            rollup = props["Start Date"]["rollup"]
-            if rollup["type"] == "date" and rollup.get("date"):
-                device_data["Start Date"] = rollup["date"]["start"]
-            elif rollup["type"] == "array" and rollup["array"]:
-                first_item = rollup["array"][0]
-                if first_item["type"] == "date" and first_item.get("date"):
-                    device_data["Start Date"] = first_item["date"]["start"]
-                else:
-                    device_data["Start Date"] = None
-            else:
-                device_data["Start Date"] = None
-        else:
-            device_data["Start Date"] = None
-    except:
-        device_data["Start Date"] = None
+    with st.spinner("Comprobando que siguen disponibles..."), span("revalidate"):
+        pages, errors = fetch_pages(device_ids, DEVICES_ID)
+        fresh = [extract_device_data(page) for page in pages.values()]
     
-    # Extraer End Date
-    try:
-        if props.get("End Date") and props["End Date"]["rollup"]:
-            rollup = props["End Date"]["rollup"]
-            if rollup["type"] == "date" and rollup.get("date"):
-                device_data["End Date"] = rollup["date"]["start"]
-            elif rollup["type"] == "array" and rollup["array"]:
-                first_item = rollup["array"][0]
-                if first_item["type"] == "date" and first_item.get("date"):
-                    device_data["End Date"] = first_item["date"]["start"]
-                else:
-                    device_data["End Date"] = None
-            else:
-                device_data["End Date"] = None
-        else:
-            device_data["End Date"] = None
-    except:
-        device_data["End Date"] = None
+    update_catalog(fresh, catalog)
+    taken = {device.id for device in fresh if not check_availability(device, query_start, query_end)}
+    if not taken and not errors:
+        return
+    
+    selection = st.session_state.selected_devices
+    for device_id in taken | set(errors):
+        selection.discard(device_id)
+    reset_checkboxes(taken | set(errors))
+    st.session_state.selection_version += 1
+    
+    # Los ya reservados salen de la lista; los que no se pudieron leer se quedan
+    st.session_state.available_devices = [
+        catalog.get(device.id) or device
+        for device in st.session_state.available_devices
+        if device.id not in taken
+    ]
+    
+    notices = []
+    if taken:
+        names = ", ".join(sorted(catalog.display_name(catalog.get(device_id)) for device_id in taken))
+        notices.append(f"⚠️ Ya no están disponibles (los ha reservado otra persona): {names}")
+    if errors:
+        notices.append(f"⚠️ No se pudieron comprobar {len(errors)} dispositivos; se han quitado de la selección")
+    st.session_state.assign_notices = notices
+    st.rerun()
+
+
+def apply_assignment(device_ids, location_id, start_date, end_date, catalog, since):
+    """
+    Refleja en el catálogo una asignación ya hecha en Notion, sin descargar nada
+
+    A cada dispositivo se le añade la reserva nueva y conserva las que ya
+    tenía, igual que en Notion. El índice de disponibilidad se reconstruye en local y, en
+    segundo plano, se comprueba contra Notion lo que se ha editado desde `since`.
+    """
+    devices, _ = catalog.resolve(device_ids)
+    update_catalog([with_location(device, location_id, start_date, end_date) for device in devices], catalog)
+    get_in_house_locations.clear()
     
-    return device_data
+    threading.Thread(
+        target=reconcile_assignment,
+        args=(device_ids, since, catalog),
+        daemon=True,
+    ).start()
+
+
+def reconcile_assignment(device_ids, since, catalog):
+    """
+    Relee de Notion los dispositivos editados desde `since` y corrige el catálogo
+
+    Se ejecuta en un hilo aparte. Si Notion todavía no devuelve todos los
+    asignados se vuelve a intentar; si no lo consigue se vacía la caché y la
+    próxima consulta lo descarga todo.
+    """
+    pending = set(device_ids)
+    edited_filter = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": since}}
+    
+    for attempt in range(RECONCILE_ATTEMPTS):
+        time.sleep(RECONCILE_DELAY * (attempt + 1))
+        try:
+            pages = get_all_pages(DEVICES_ID, filter=edited_filter)
+        except (NotionAPIError, requests.RequestException):
+            continue
+        
+        fresh = [extract_device_data(page) for page in pages]
+        update_catalog(fresh, catalog)
+        pending -= {device.id for device in fresh}
+        if not pending:
+            return
+    
+    invalidate_cache()
 
 
 def check_availability(device, start_date, end_date):
-    """Verifica si un dispositivo está disponible en el rango de fechas"""
+    """Verifica si un dispositivo está disponible en el rango de fechas (contra todas sus reservas)"""
     
     # Sin ubicación = disponible
-    if device["Locations_demo_count"] == 0:
+    if device.locations_count == 0:
         return True
     
-    # Tiene ubicación, verificar fechas
-    device_start = device["Start Date"]
-    device_end = device["End Date"]
-    
-    # Con ubicación pero sin fechas = ocupado indefinidamente
-    if device_start is None and device_end is None:
+    # Con ubicación pero sin reservas leídas = ocupado indefinidamente
+    if not device.bookings:
         return False
     
-    # Convertir strings a objetos date
-    try:
-        if device_start:
-            device_start_date = datetime.fromisoformat(device_start).date()
-        else:
-            device_start_date = None
-            
-        if device_end:
-            device_end_date = datetime.fromisoformat(device_end).date()
-        else:
-            device_end_date = None
-    except:
+    # Tiene ubicación, verificar las fechas de cada reserva
+    return all(check_booking(booking, start_date, end_date) for booking in device.bookings)
+
+
+def check_booking(booking, start_date, end_date):
+    """Verifica si una reserva deja libre el rango de fechas"""
+    device_start_date = booking.start
+    device_end_date = booking.end
+    
+    # Con ubicación pero sin fechas = ocupado indefinidamente
+    if device_start_date is None and device_end_date is None:
         return False
     
     # Verificar solapamiento
@@ -186,58 +351,36 @@ def check_availability(device, start_date, end_date):
     return True
 
 
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
 def get_in_house_locations():
     """Obtiene locations de tipo In House con contador de devices desde campo Units"""
-    url = f"https://api.notion.com/v1/databases/{LOCATIONS_ID}/query"
-    
-    payload = {
-        "filter": {
+    if MIRROR_ENABLED:
+        pages = [
+            page for page in get_pages(LOCATIONS_ID)
+            if extract_location_fields(page["properties"])["type"] == "In House"
+        ]
+    else:
+        in_house_filter = {
             "property": "Type",
             "select": {
                 "equals": "In House"
             }
-        },
-        "page_size": 100
-    }
-    
-    response = requests.post(url, json=payload, headers=headers)
-    data = response.json()
+        }
+        
+        pages = get_all_pages(LOCATIONS_ID, filter=in_house_filter)
     
     locations = []
-    for page in data.get("results", []):
-        props = page["properties"]
+    for page in pages:
+        fields = extract_location_fields(page["properties"])
         
-        # Extraer Name
-        try:
-            if props.get("Name") and props["Name"]["title"]:
-                name = props["Name"]["title"][0]["text"]["content"]
-            else:
-                name = "Sin nombre"
-        except:
-            name = "Sin nombre"
-        
-        # Extraer Units como device_count
-        try:
-            if props.get("Units") and props["Units"]["number"] is not None:
-                device_count = props["Units"]["number"]
-            else:
-                device_count = 0
-        except:
-            device_count = 0
-        
-        locations.append({
-            "id": page["id"],
-            "name": name,
-            "device_count": device_count
-        })
+        # Units como device_count
+        locations.append(Location(page["id"], fields["name"] or NO_NAME, fields["units"] or 0))
     
     return locations
 
 
 def create_in_house_location(name, start_date):
     """Crea una nueva location In House en Notion"""
-    url = "https://api.notion.com/v1/pages"
-    
     payload = {
         "parent": {"database_id": LOCATIONS_ID},
         "properties": {
@@ -263,27 +406,45 @@ def create_in_house_location(name, start_date):
         }
     }
     
-    response = requests.post(url, json=payload, headers=headers)
+    response = notion_request("POST", "pages", payload)
     
     if response.status_code == 200:
         data = response.json()
         st.success(f"✅ Ubicación '{name}' creada correctamente")
+        get_in_house_locations.clear()
         return data["id"]
     else:
         st.error(f"❌ Error al crear ubicación: {response.text}")
         return None
 
 
-def assign_devices_client(device_names, client_name, start_date, end_date, available_devices):
+def start_job(device_ids, location_name, location_type, catalog, start_date, end_date=None, location_id=None):
+    """Apunta en el diario un trabajo de asignación con la relación actual de cada dispositivo"""
+    devices, _ = catalog.resolve(device_ids)
+    return journal.create(
+        location_name,
+        location_type,
+        [device.id for device in devices],
+        {device.id: device.location_ids for device in devices},
+        start=start_date,
+        end=end_date,
+        location_id=location_id,
+    )
+
+
+def assign_devices_client(device_ids, client_name, start_date, end_date, catalog):
     """Asigna dispositivos a un cliente (crea nueva location Client)"""
     
     if not client_name or client_name.strip() == "":
         st.error("⚠️ El nombre del destino no puede estar vacío")
         return False
     
-    # 1. Crear la location Client
-    url_location = "https://api.notion.com/v1/pages"
+    revalidate_selection(device_ids, catalog)
     
+    # El trabajo se apunta antes de crear nada en Notion
+    job_id = start_job(device_ids, client_name, "Client", catalog, start_date, end_date)
+    
+    # 1. Crear la location Client
     payload_location = {
         "parent": {"database_id": LOCATIONS_ID},
         "properties": {
@@ -315,124 +476,623 @@ def assign_devices_client(device_names, client_name, start_date, end_date, avail
     }
     
     with st.spinner(f"Creando destino '{client_name}'..."):
-        response_location = requests.post(url_location, json=payload_location, headers=headers)
+        response_location = notion_request("POST", "pages", payload_location)
     
     if response_location.status_code != 200:
         st.error(f"❌ Error al crear el destino: {response_location.text}")
+        cancel_job(journal, journal.get(job_id))
         return False
     
     location_data = response_location.json()
     location_id = location_data["id"]
+    journal.location_created(job_id, location_id)
     
     st.success(f"✅ Destino '{client_name}' creado")
     
-    # 2. Asignar cada dispositivo a esta location
-    success_count = 0
-    url_patch = "https://api.notion.com/v1/pages/"
+    # 2. Asignar los dispositivos a esta location
+    return assign_to_location(device_ids, location_id, client_name, catalog, job_id, start_date, end_date)
+
+
+def assign_devices_in_house(device_ids, location_id, location_name, start_date, catalog):
+    """Asigna dispositivos a una ubicación In House existente (sin fecha de fin)"""
+    job_id = start_job(device_ids, location_name, "In House", catalog, start_date, location_id=location_id)
+    return assign_to_location(device_ids, location_id, location_name, catalog, job_id, start_date)
+
+
+def create_and_assign_in_house(device_ids, location_name, start_date, catalog):
+    """Crea una ubicación In House y le asigna los dispositivos (al deshacer el trabajo se archiva)"""
+    
+    # El trabajo se apunta antes de crear nada en Notion
+    job_id = start_job(device_ids, location_name, "In House", catalog, start_date)
+    
+    with st.spinner("Creando ubicación..."):
+        location_id = create_in_house_location(location_name, start_date)
+    
+    if not location_id:
+        cancel_job(journal, journal.get(job_id))
+        return False
+    
+    journal.location_created(job_id, location_id)
+    return assign_to_location(device_ids, location_id, location_name, catalog, job_id, start_date)
+
+
+def assign_to_location(device_ids, location_id, location_name, catalog, job_id, start_date, end_date=None):
+    """Apunta los dispositivos a la location en paralelo, mostrando el progreso y apuntándolo en el diario"""
+    
+    # Buscar cada dispositivo por su id en el catálogo
+    devices, missing_ids = catalog.resolve(device_ids)
+    for device_id in missing_ids:
+        st.warning(f"⚠️ No se encontró el dispositivo con ID '{device_id}'")
+    
+    names_by_id = {device.id: catalog.display_name(device) for device in devices}
     
     progress_bar = st.progress(0)
-    total = len(device_names)
-    
-    for idx, device_name in enumerate(device_names):
-        # Buscar el device_id en available_devices
-        device_id = None
-        for device in available_devices:
-            if device["Name"] == device_name:
-                device_id = device["id"]
-                break
-        
-        if not device_id:
-            st.warning(f"⚠️ No se encontró el ID para '{device_name}'")
-            continue
-        
-        payload_device = {
-            "properties": {
-                "Location": {   # Cambiado de 📍 Locations_demo
-                    "relation": [
-                        {"id": location_id}
-                    ]
-                }
-            }
-        }
-                
-        response_device = requests.patch(f"{url_patch}{device_id}", json=payload_device, headers=headers)
-        
-        if response_device.status_code == 200:
-            success_count += 1
-        else:
-            st.warning(f"⚠️ Error al asignar '{device_name}': {response_device.text}")
-        
-        progress_bar.progress((idx + 1) / total)
+    total = len(device_ids)
+    
+    def show_progress(result, report):
+        # Los resultados llegan según van terminando los PATCH en paralelo
+        if not result.ok:
+            st.warning(f"⚠️ Error al asignar '{names_by_id[result.device_id]}': {result.error}")
+        progress_bar.progress(report.total / total)
+    
+    # Notion redondea last_edited_time al minuto
+    since = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:00.000Z")
+    
+    # revalidate_selection acaba de releer los seleccionados: el catálogo tiene su relación completa
+    current = {device.id: device.location_ids for device in devices}
+    
+    with span("assign"):
+        report = run_job(journal, job_id, list(names_by_id), location_id, on_result=show_progress, current=current)
     
     progress_bar.empty()
     
-    if success_count == len(device_names):
-        st.success(f"🎉 ¡Perfecto! {success_count} dispositivos asignados a '{client_name}'")
+    success_count = len(report.succeeded)
+    
+    # Las ubicaciones de los dispositivos han cambiado: se actualiza el catálogo en memoria
+    if success_count > 0:
+        apply_assignment(report.succeeded, location_id, start_date, end_date, catalog, since)
+    
+    if success_count == len(device_ids):
+        st.success(f"🎉 ¡Perfecto! {success_count} dispositivos asignados a '{location_name}'")
         return True
     elif success_count > 0:
-        st.warning(f"⚠️ Se asignaron {success_count} de {len(device_names)} dispositivos")
+        st.warning(f"⚠️ Se asignaron {success_count} de {len(device_ids)} dispositivos")
         return True
     else:
         st.error("❌ No se pudo asignar ningún dispositivo")
         return False
 
 
-def assign_devices_in_house(device_names, location_id, location_name, start_date, available_devices):
-    """Asigna dispositivos a una ubicación In House existente"""
+def render_device_cards(devices, catalog):
+    """Lista de tarjetas con un checkbox por dispositivo"""
+    for device in devices:
+        device_id = device.id
+        device_name = catalog.display_name(device)
+        
+        # Columnas para checkbox y cajetín
+        inner_col1, inner_col2 = st.columns([0.5, 9.5])
+        
+        with inner_col1:
+            # Checkbox
+            checkbox_value = st.checkbox(
+                "",
+                value=device_id in st.session_state.selected_devices,
+                key=f"check_{device_id}",
+                label_visibility="collapsed"
+            )
+            
+            # Actualizar la selección
+            if st.session_state.selected_devices.set(device_id, checkbox_value):
+                st.session_state.selection_version += 1
+        
+        with inner_col2:
+            # Solo mostrar el nombre (sin tags)
+            st.markdown(
+                f"""
+                <div style='padding: 8px 12px; 
+                            background-color: {"#B3E5E6" if checkbox_value else "#e0e0e0"}; 
+                            border-radius: 6px; 
+                            margin-top: -8px;
+                            border-left: 4px solid {"#00859B" if checkbox_value else "#9e9e9e"};'>
+                    <p style='margin: 0; font-size: 16px; font-weight: 500; color: #333;'>
+                        {device_name}
+                    </p>
+                </div>
+                """,
+                unsafe_allow_html=True
+            )
+        
+        # Espacio entre dispositivos
+        st.markdown("<div style='margin-bottom: 10px;'></div>", unsafe_allow_html=True)
+
+
+def render_device_table(devices, catalog, view_key):
+    """
+    Una sola tabla (st.data_editor) con una columna para seleccionar
+
+    Es un único widget para todos los dispositivos, así que marcar uno no
+    vuelve a enviar cientos de elementos. Se puede ordenar por columna.
+    view_key distingue cada filtro y página (cada uno tiene su propia tabla).
+    """
+    selection = st.session_state.selected_devices
+    table = pd.DataFrame(
+        {
+            "Seleccionar": [device.id in selection for device in devices],
+            "Nombre": [catalog.display_name(device) for device in devices],
+            "Etiqueta": [device.tag for device in devices],
+        },
+        index=[device.id for device in devices],
+    )
     
-    success_count = 0
-    url_patch = "https://api.notion.com/v1/pages/"
+    # La clave cambia si la selección se modifica fuera de la tabla (tarjetas,
+    # asignación...), para no aplicar encima ediciones antiguas de la tabla
+    edited = st.data_editor(
+        table,
+        key=f"device_table_{st.session_state.selection_version}_{view_key}",
+        hide_index=True,
+        use_container_width=True,
+        disabled=["Nombre", "Etiqueta"],
+        column_config={
+            "Seleccionar": st.column_config.CheckboxColumn("✔", width="small"),
+        },
+    )
     
-    progress_bar = st.progress(0)
-    total = len(device_names)
-    
-    for idx, device_name in enumerate(device_names):
-        # Buscar el device_id en available_devices
-        device_id = None
-        for device in available_devices:
-            if device["Name"] == device_name:
-                device_id = device["id"]
-                break
-        
-        if not device_id:
-            st.warning(f"⚠️ No se encontró el ID para '{device_name}'")
-            continue
+    # Actualizar la selección (mantiene el orden en que se seleccionaron)
+    for device_id, is_selected in edited["Seleccionar"].items():
+        selection.set(device_id, bool(is_selected))
+
+
+def initial_letter(name):
+    """Letra para el índice alfabético: mayúscula sin tilde, o "#" si no es una letra"""
+    letter = unicodedata.normalize("NFD", name[:1])[:1].upper()
+    return letter if letter.isalpha() else "#"
+
+
+def letter_pages(devices, page_size):
+    """Página (empezando en 1) en la que aparece el primer dispositivo de cada letra"""
+    pages = {}
+    for position, device in enumerate(devices):
+        pages.setdefault(initial_letter(device.name), position // page_size + 1)
+    return pages
+
+
+def jump_to_letter(pages):
+    """Callback del selector de letra: va a su página y deja el selector vacío"""
+    letter = st.session_state.device_letter
+    if letter in pages:
+        st.session_state.device_page = pages[letter]
+    st.session_state.device_letter = None
+
+
+def reset_checkboxes(device_ids):
+    """
+    Borra el estado de los checkboxes de las tarjetas de esos dispositivos
+
+    Cada checkbox guarda su propio valor en session_state; si no se borra, la
+    siguiente ejecución vuelve a meter en la selección lo que se ha quitado.
+    """
+    for device_id in device_ids:
+        st.session_state.pop(f"check_{device_id}", None)
+
+
+def bulk_select(action, device_ids):
+    """Callback de los botones de selección en bloque (sobre los dispositivos del filtro)"""
+    selection = st.session_state.selected_devices
+    if action == "select":
+        selection.select_all(device_ids)
+    elif action == "clear":
+        selection.clear(device_ids)
+    else:
+        selection.toggle_all(device_ids)
+    
+    reset_checkboxes(device_ids)
+    st.session_state.selection_version += 1
+
+
+@st.fragment
+@traced_fragment("device_list")
+def device_list_fragment(available_devices, catalog):
+    """
+    Filtro por etiqueta y lista de dispositivos para seleccionar
+
+    Se ejecuta como fragmento: al marcar o desmarcar un dispositivo sólo se
+    vuelve a ejecutar esta parte. La página entera sólo se recarga cuando
+    el formulario de asignación tiene que aparecer o desaparecer.
+    """
+    # ========================================
+    # 🔹 CORREGIDO: Obtener tags únicos (select, no multi_select)
+    # ========================================
+    # Como Tags es un campo "select" con un solo valor por dispositivo,
+    # simplemente recopilamos todos los valores únicos
+    
+    unique_tags = set()  # Set para evitar duplicados
+    for device in available_devices:
+        # Cada dispositivo tiene un solo tag (string)
+        if device.tag and device.tag != NO_TAG:
+            unique_tags.add(device.tag)
+    
+    # Convertir a lista ordenada
+    unique_tags = sorted(unique_tags)
+    
+    # Añadir "Todos" como primera opción
+    filter_options = ["Todos"] + unique_tags
+    # ========================================
+    
+    # ========================================
+    # 🔹 Selector de filtro por Tag
+    # ========================================
+    st.markdown("---")
+    selected_tag = st.selectbox(
+        "🔍 Filtrar por etiqueta",
+        options=filter_options,
+        index=0,  # "Todos" seleccionado por defecto
+        key="tag_filter"
+    )
+    # ========================================
+    
+    # ========================================
+    # 🔹 CORREGIDO: Aplicar filtro (comparación directa)
+    # ========================================
+    # Ahora comparamos directamente el string del tag
+    if selected_tag == "Todos":
+        filtered_devices = available_devices
+    else:
+        # Filtramos: un dispositivo se incluye si su tag coincide exactamente
+        filtered_devices = [d for d in available_devices if d.tag == selected_tag]
+    # ========================================
+    
+    # Mostrar contador de dispositivos filtrados
+    if selected_tag != "Todos":
+        st.info(f"📊 Mostrando {len(filtered_devices)} dispositivos con etiqueta '{selected_tag}'")
+    
+    # Ordenar alfabéticamente los dispositivos filtrados
+    with span("sort"):
+        available_devices_sorted = sorted(filtered_devices, key=lambda d: d.name)
+    filtered_ids = [device.id for device in available_devices_sorted]
+    
+    # Selección en bloque de todos los dispositivos del filtro (de todas las páginas)
+    bulk_col1, bulk_col2, bulk_col3 = st.columns(3)
+    with bulk_col1:
+        st.button("Seleccionar todos", use_container_width=True,
+                  on_click=bulk_select, args=("select", filtered_ids))
+    with bulk_col2:
+        st.button("Quitar todos", use_container_width=True,
+                  on_click=bulk_select, args=("clear", filtered_ids))
+    with bulk_col3:
+        st.button("Invertir selección", use_container_width=True,
+                  on_click=bulk_select, args=("toggle", filtered_ids))
+    
+    # Selector de dispositivos con checkboxes
+    st.markdown("---")
+    st.subheader("Selecciona los dispositivos que quieres asignar")
+    
+    # Vista de selección: tarjetas (una por dispositivo) o una única tabla
+    view = st.radio(
+        "Vista",
+        ["Tarjetas", "Tabla"],
+        horizontal=True,
+        key="device_view",
+        label_visibility="collapsed"
+    )
+    
+    # Paginación: sólo se envían al navegador los dispositivos de la página
+    # actual (la selección se guarda por id, así que se mantiene entre páginas)
+    page_size = st.session_state.get("device_page_size", PAGE_SIZE)
+    total_pages = max(1, -(-len(available_devices_sorted) // page_size))
+    if st.session_state.get("device_page", 1) > total_pages:
+        st.session_state.device_page = total_pages
+    
+    if len(available_devices_sorted) > min(PAGE_SIZE_OPTIONS):
+        nav_col1, nav_col2, nav_col3 = st.columns(3)
         
-        payload_device = {
-            "properties": {
-                "Location": {   # Cambiado de 📍 Locations_demo
-                    "relation": [
-                        {"id": location_id}
-                    ]
-                }
-            }
-        }
+        with nav_col1:
+            page = st.number_input(
+                "Página",
+                min_value=1,
+                max_value=total_pages,
+                step=1,
+                key="device_page"
+            )
         
-        response_device = requests.patch(f"{url_patch}{device_id}", json=payload_device, headers=headers)
+        with nav_col2:
+            pages_by_letter = letter_pages(available_devices_sorted, page_size)
+            st.selectbox(
+                "Ir a la letra",
+                options=list(pages_by_letter),
+                index=None,
+                placeholder="A-Z",
+                key="device_letter",
+                on_change=jump_to_letter,
+                args=(pages_by_letter,)
+            )
         
-        if response_device.status_code == 200:
-            success_count += 1
+        with nav_col3:
+            st.selectbox(
+                "Por página",
+                options=PAGE_SIZE_OPTIONS,
+                index=PAGE_SIZE_OPTIONS.index(PAGE_SIZE),
+                key="device_page_size"
+            )
+    else:
+        page = 1
+    
+    first = (page - 1) * page_size
+    page_devices = available_devices_sorted[first:first + page_size]
+    if total_pages > 1:
+        st.caption(
+            f"Mostrando {first + 1}-{first + len(page_devices)} de {len(available_devices_sorted)} "
+            f"(página {page} de {total_pages})"
+        )
+    
+    # Mostrar los dispositivos ordenados y filtrados
+    with span("render_list"):
+        if view == "Tabla":
+            render_device_table(page_devices, catalog, f"{selected_tag}_{page}")
         else:
-            st.warning(f"⚠️ Error al asignar '{device_name}': {response_device.text}")
-        
-        progress_bar.progress((idx + 1) / total)
+            render_device_cards(page_devices, catalog)
     
-    progress_bar.empty()
+    # Resumen de la selección (aquí para que se actualice con cada clic)
+    selection = st.session_state.selected_devices
+    if selection:
+        selected_list = ", ".join(
+            catalog.display_name(device)
+            for device in catalog.resolve(selection)[0]
+        )
+        st.info(f"**Seleccionados ({len(selection)}):** {selected_list}")
+    
+    # El formulario está en otro fragmento: si pasa de no haber selección a
+    # haberla (o al revés) hay que recargar la página para mostrarlo u ocultarlo
+    if bool(selection) != st.session_state.get("form_visible", False):
+        st.session_state.form_visible = bool(selection)
+        st.rerun()
+
+
+def finish_assignment():
+    """
+    Tras asignar: vacía la selección y quita de la lista los que ya no están libres
+
+    La lista se recalcula con el catálogo actualizado, así se puede seguir
+    asignando sin volver a consultar Notion.
+    """
+    catalog = st.session_state.catalog
+    query_start = st.session_state.query_start_date
+    query_end = st.session_state.query_end_date
+    
+    available_devices = []
+    for device in st.session_state.available_devices:
+        device = catalog.get(device.id) or device
+        if check_availability(device, query_start, query_end):
+            available_devices.append(device)
+    
+    st.session_state.available_devices = available_devices
+    selection = st.session_state.selected_devices
+    reset_checkboxes(selection.ids())
+    selection.clear()
+    st.session_state.selection_version += 1
+    st.rerun()
+
+
+@st.fragment
+@traced_fragment("assignment_form")
+def assignment_form_fragment(catalog):
+    """
+    Formulario de asignación de los dispositivos seleccionados
+
+    También es un fragmento: escribir en él no vuelve a pintar la lista. Lee
+    la selección en el momento de asignar, así que siempre usa la actual.
+    """
+    # Mostrar formulario de asignación si hay dispositivos seleccionados
+    st.session_state.form_visible = bool(st.session_state.selected_devices)
+    
+    # Avisos de la última comprobación antes de asignar (se muestran una vez)
+    for notice in st.session_state.pop("assign_notices", []):
+        st.warning(notice)
+    
+    if not st.session_state.form_visible:
+        return
+    
+    st.markdown("---")
+    st.subheader("🎯 Asignar ubicación")
+    
+    # Selector de tipo de ubicación - DESPLEGABLE
+    location_type = st.selectbox(
+        "Tipo de Ubicación",
+        ["Client", "In House"],
+        index=0,  # Client por defecto
+        key="location_type"
+    )
+    
+
+    
+    # Mostrar fechas según el tipo
+    if location_type == "Client":
+        query_start = st.session_state.query_start_date
+        query_end = st.session_state.query_end_date
+        st.info(f"📅 **Fechas:** {query_start.strftime('%d/%m/%Y')} - {query_end.strftime('%d/%m/%Y')}")
+    else:  # In House
+        today = date.today()
+        st.info(f"📅 **Fecha de inicio:** {today.strftime('%d/%m/%Y')}")
+    
+    st.markdown("---")
+    
+    # Formulario según el tipo
+    if location_type == "Client":
+        # FORMULARIO CLIENT
+        st.write("**📋 Nuevo Destino Cliente**")
+        
+        client_name = st.text_input(
+            "Nombre del Destino",
+            placeholder="Ej: Destino Barcelona 2025",
+            key="client_name_input"
+        )
+        
+        if st.button("Asignar", type="primary", use_container_width=True, key="assign_client"):
+            query_start = st.session_state.query_start_date
+            query_end = st.session_state.query_end_date
+            
+            # Los ids seleccionados se resuelven contra el catálogo completo
+            success = assign_devices_client(
+                st.session_state.selected_devices,
+                client_name,
+                query_start,
+                query_end,
+                catalog
+            )
+            
+            if success:
+                finish_assignment()
     
-    if success_count == len(device_names):
-        st.success(f"🎉 ¡Perfecto! {success_count} dispositivos asignados a '{location_name}'")
-        return True
-    elif success_count > 0:
-        st.warning(f"⚠️ Se asignaron {success_count} de {len(device_names)} dispositivos")
-        return True
     else:
-        st.error("❌ No se pudo asignar ningún dispositivo")
-        return False
+        # FORMULARIO IN HOUSE
+        st.write("**🏠 Asignar a In House**")
+        
+        # Obtener locations In House
+        with st.spinner("Cargando ubicaciones In House..."), span("in_house_locations"):
+            in_house_locations = get_in_house_locations()
+        
+        if not in_house_locations:
+            st.warning("⚠️ No hay ubicaciones In House disponibles")
+            st.info("💡 Crea una nueva ubicación In House")
+            
+            # Formulario para crear nueva
+            new_in_house_name = st.text_input(
+                "Nombre de la ubicación",
+                placeholder="Ej: Casa Juan",
+                key="new_in_house_name"
+            )
+            
+            if st.button("Crear y Asignar", type="primary", use_container_width=True, key="create_in_house"):
+                if not new_in_house_name or new_in_house_name.strip() == "":
+                    st.error("⚠️ El nombre no puede estar vacío")
+                else:
+                    revalidate_selection(st.session_state.selected_devices, catalog)
+                    success = create_and_assign_in_house(
+                        st.session_state.selected_devices,
+                        new_in_house_name,
+                        date.today(),
+                        catalog
+                    )
+                    
+                    if success:
+                        finish_assignment()
+        
+        else:
+            # Mostrar dropdown con locations existentes
+            location_options = {
+                f"📍 {loc.name} ({loc.device_count} devices)": loc.id
+                for loc in in_house_locations
+            }
+            
+            selected_location_display = st.selectbox(
+                "Seleccionar ubicación existente",
+                options=list(location_options.keys()),
+                key="in_house_location"
+            )
+            
+            selected_location_id = location_options[selected_location_display]
+            selected_location_name = selected_location_display.split(" (")[0].replace("📍 ", "")
+            
+            # Opción para crear nueva
+            with st.expander("➕ O crear nueva ubicación In House"):
+                new_in_house_name = st.text_input(
+                    "Nombre de la ubicación",
+                    placeholder="Ej: Casa María",
+                    key="new_in_house_name_alt"
+                )
+                
+                if st.button("Crear y Asignar Nueva", type="secondary", use_container_width=True,
+                             key="create_in_house_alt"):
+                    if not new_in_house_name or new_in_house_name.strip() == "":
+                        st.error("⚠️ El nombre no puede estar vacío")
+                    else:
+                        revalidate_selection(st.session_state.selected_devices, catalog)
+                        success = create_and_assign_in_house(
+                            st.session_state.selected_devices,
+                            new_in_house_name,
+                            date.today(),
+                            catalog
+                        )
+                        
+                        if success:
+                            finish_assignment()
+            
+            # Botón principal para asignar a existente
+            if st.button("Asignar", type="primary", use_container_width=True, key="assign_in_house"):
+                revalidate_selection(st.session_state.selected_devices, catalog)
+                today = date.today()
+                success = assign_devices_in_house(
+                    st.session_state.selected_devices,
+                    selected_location_id,
+                    selected_location_name,
+                    today,
+                    catalog
+                )
+                
+                if success:
+                    finish_assignment()
+
+
+def render_pending_jobs():
+    """Asignaciones que se cortaron o tuvieron fallos: reanudar, reintentar o deshacer"""
+    jobs = journal.open_jobs()
+    if not jobs:
+        return
+    
+    with st.sidebar:
+        st.header("📒 Asignaciones sin terminar")
+        for job in jobs[:10]:
+            title = f"{job.location_name} ({job.location_type}) · {job.created[:16].replace('T', ' ')}"
+            with st.expander(title):
+                st.caption(
+                    f"{len(job.assigned)} asignados, {len(job.failed)} con error, "
+                    f"{len(job.pending)} sin intentar"
+                )
+                for status, error in list(job.failed.values())[:3]:
+                    st.caption(f"⚠️ {status or 'sin respuesta'}: {(error or '')[:120]}")
+                
+                action = None
+                if job.pending and job.location_id and st.button(
+                    "Reanudar", key=f"job_resume_{job.id}", use_container_width=True
+                ):
+                    action = resume_job
+                if job.failed and st.button(
+                    "Reintentar fallidos", key=f"job_retry_{job.id}", use_container_width=True
+                ):
+                    action = retry_failed
+                if st.button("Deshacer", key=f"job_rollback_{job.id}", use_container_width=True):
+                    action = rollback_job
+                if st.button("Descartar", key=f"job_cancel_{job.id}", use_container_width=True):
+                    action = cancel_job
+                
+                if action is None:
+                    continue
+                
+                with st.spinner("Actualizando Notion..."):
+                    report = action(journal, job)
+                
+                if report is not None and report.failed:
+                    st.toast(f"⚠️ {len(report.failed)} dispositivos con error")
+                elif report is not None:
+                    st.toast(f"✅ {len(report.succeeded)} dispositivos actualizados")
+                
+                # No se sabe qué fechas tenía cada dispositivo: se vuelve a consultar todo
+                if action is not cancel_job:
+                    invalidate_cache()
+                    st.session_state.search_completed = False
+                    st.session_state.available_devices = []
+                    st.session_state.selected_devices.clear()
+                    st.session_state.selection_version += 1
+                st.rerun()
 
 
 # Inicializar estado de sesión
+# selected_devices guarda ids de página (no nombres: puede haber nombres repetidos)
 if 'selected_devices' not in st.session_state:
-    st.session_state.selected_devices = []
+    st.session_state.selected_devices = SelectionModel()
+
+# Cambia cada vez que la selección se modifica fuera de la tabla
+if 'selection_version' not in st.session_state:
+    st.session_state.selection_version = 0
 
 if 'search_completed' not in st.session_state:
     st.session_state.search_completed = False
@@ -440,6 +1100,10 @@ if 'search_completed' not in st.session_state:
 if 'available_devices' not in st.session_state:
     st.session_state.available_devices = []
 
+# Catálogo (índice por id) de la última consulta; es compartido, no se copia por sesión
+if 'catalog' not in st.session_state:
+    st.session_state.catalog = DeviceCatalog([])
+
 if 'query_start_date' not in st.session_state:
     st.session_state.query_start_date = date.today()
 
@@ -454,14 +1118,16 @@ with col1:
     start_date = st.date_input(
         "Fecha de inicio",
         value=date.today(),
-        format="DD/MM/YYYY"
+        format="DD/MM/YYYY",
+        key="start_date"
     )
 
 with col2:
     end_date = st.date_input(
         "Fecha de fin",
         value=date.today(),
-        format="DD/MM/YYYY"
+        format="DD/MM/YYYY",
+        key="end_date"
     )
 
 # Validación de fechas
@@ -470,292 +1136,52 @@ if start_date > end_date:
     st.stop()
 
 # Botón de búsqueda
-if st.button("🔍 Consultar Disponibilidad", type="primary", use_container_width=True):
+if st.button("🔍 Consultar Disponibilidad", type="primary", use_container_width=True, key="search"):
     with st.spinner("Consultando dispositivos..."):
-        # Obtener todos los devices
-        pages = get_pages(DEVICES_ID)
-        all_devices = [extract_device_data(page) for page in pages]
-        
-        # Filtrar disponibles
-        available_devices = [
-            device for device in all_devices 
-            if check_availability(device, start_date, end_date)
-        ]
+        try:
+            catalog, available_devices = find_available_devices(start_date, end_date)
+        except NotionAPIError as error:
+            st.error(f"❌ Error al consultar Notion: {error}")
+            st.stop()
         
         # Guardar en session_state
         st.session_state.available_devices = available_devices
+        st.session_state.catalog = catalog
         st.session_state.query_start_date = start_date
         st.session_state.query_end_date = end_date
         st.session_state.search_completed = True
-        st.session_state.selected_devices = []
+        st.session_state.selected_devices.clear()
+        st.session_state.selection_version += 1
 
 # Mostrar resultados si la búsqueda se completó
 if st.session_state.search_completed:
     available_devices = st.session_state.available_devices
+    catalog = st.session_state.catalog
     
     if available_devices:
         st.success(f"✅ Hay {len(available_devices)} dispositivos disponibles")
         
-        # ========================================
-        # 🔹 CORREGIDO: Obtener tags únicos (select, no multi_select)
-        # ========================================
-        # Como Tags es un campo "select" con un solo valor por dispositivo,
-        # simplemente recopilamos todos los valores únicos
-        
-        unique_tags = set()  # Set para evitar duplicados
-        for device in available_devices:
-            # Cada dispositivo tiene un solo tag (string)
-            if device["Tags"] and device["Tags"] != "Sin tag":
-                unique_tags.add(device["Tags"])
-        
-        # Convertir a lista ordenada
-        unique_tags = sorted(unique_tags)
-        
-        # Añadir "Todos" como primera opción
-        filter_options = ["Todos"] + unique_tags
-        # ========================================
-        
-        # ========================================
-        # 🔹 Selector de filtro por Tag
-        # ========================================
-        st.markdown("---")
-        selected_tag = st.selectbox(
-            "🔍 Filtrar por etiqueta",
-            options=filter_options,
-            index=0  # "Todos" seleccionado por defecto
-        )
-        # ========================================
-        
-        # ========================================
-        # 🔹 CORREGIDO: Aplicar filtro (comparación directa)
-        # ========================================
-        # Ahora comparamos directamente el string del tag
-        if selected_tag == "Todos":
-            filtered_devices = available_devices
-        else:
-            # Filtramos: un dispositivo se incluye si su tag coincide exactamente
-            filtered_devices = [d for d in available_devices if d["Tags"] == selected_tag]
-        # ========================================
-        
-        # Mostrar contador de dispositivos filtrados
-        if selected_tag != "Todos":
-            st.info(f"📊 Mostrando {len(filtered_devices)} dispositivos con etiqueta '{selected_tag}'")
-        
-        # Ordenar alfabéticamente los dispositivos filtrados
-        available_devices_sorted = sorted(filtered_devices, key=lambda d: d["Name"])
-        
-        # Selector de dispositivos con checkboxes
-        st.markdown("---")
-        st.subheader("Selecciona los dispositivos que quieres asignar")
+        # Avisar de nombres repetidos (se distinguen por el inicio de su ID)
+        duplicate_names = sorted({d.name for d in available_devices if catalog.is_duplicate(d)})
+        if duplicate_names:
+            st.warning(f"⚠️ Hay varios dispositivos con el mismo nombre: {', '.join(duplicate_names)}")
         
-        # Mostrar los dispositivos ordenados y filtrados
-        for device in available_devices_sorted:
-            device_name = device["Name"]
-            
-            # Columnas para checkbox y cajetín
-            inner_col1, inner_col2 = st.columns([0.5, 9.5])
-            
-            with inner_col1:
-                # Checkbox
-                checkbox_value = st.checkbox(
-                    "",
-                    value=device_name in st.session_state.selected_devices,
-                    key=f"check_{device_name}",
-                    label_visibility="collapsed"
-                )
-                
-                # Actualizar lista de seleccionados
-                if checkbox_value and device_name not in st.session_state.selected_devices:
-                    st.session_state.selected_devices.append(device_name)
-                elif not checkbox_value and device_name in st.session_state.selected_devices:
-                    st.session_state.selected_devices.remove(device_name)
-            
-            with inner_col2:
-                # Solo mostrar el nombre (sin tags)
-                st.markdown(
-                    f"""
-                    <div style='padding: 8px 12px; 
-                                background-color: {"#B3E5E6" if checkbox_value else "#e0e0e0"}; 
-                                border-radius: 6px; 
-                                margin-top: -8px;
-                                border-left: 4px solid {"#00859B" if checkbox_value else "#9e9e9e"};'>
-                        <p style='margin: 0; font-size: 16px; font-weight: 500; color: #333;'>
-                            {device_name}
-                        </p>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
-            
-            # Espacio entre dispositivos
-            st.markdown("<div style='margin-bottom: 10px;'></div>", unsafe_allow_html=True)
-        
-        # Mostrar formulario de asignación si hay dispositivos seleccionados
-        if st.session_state.selected_devices:
-            st.markdown("---")
-            st.subheader(f"🎯 Asignar ubicación ({len(st.session_state.selected_devices)} dispositivos)")
-            
-            # Selector de tipo de ubicación - DESPLEGABLE
-            location_type = st.selectbox(
-                "Tipo de Ubicación",
-                ["Client", "In House"],
-                index=0  # Client por defecto
-            )
-            
-        
-            
-            # Información de dispositivos seleccionados
-            selected_list = ", ".join(st.session_state.selected_devices)
-            st.info(f"**Seleccionados:** {selected_list}")
-            
-            # Mostrar fechas según el tipo
-            if location_type == "Client":
-                query_start = st.session_state.query_start_date
-                query_end = st.session_state.query_end_date
-                st.info(f"📅 **Fechas:** {query_start.strftime('%d/%m/%Y')} - {query_end.strftime('%d/%m/%Y')}")
-            else:  # In House
-                today = date.today()
-                st.info(f"📅 **Fecha de inicio:** {today.strftime('%d/%m/%Y')}")
-            
-            st.markdown("---")
-            
-            # Formulario según el tipo
-            if location_type == "Client":
-                # FORMULARIO CLIENT
-                st.write("**📋 Nuevo Destino Cliente**")
-                
-                client_name = st.text_input(
-                    "Nombre del Destino",
-                    placeholder="Ej: Destino Barcelona 2025",
-                    key="client_name_input"
-                )
-                
-                if st.button("Asignar", type="primary", use_container_width=True):
-                    query_start = st.session_state.query_start_date
-                    query_end = st.session_state.query_end_date
-                    
-                    # Usamos available_devices original (lista completa)
-                    success = assign_devices_client(
-                        st.session_state.selected_devices,
-                        client_name,
-                        query_start,
-                        query_end,
-                        st.session_state.available_devices
-                    )
-                    
-                    if success:
-                        st.session_state.selected_devices = []
-                        st.session_state.search_completed = False
-                        st.session_state.available_devices = []
-                        st.rerun()
-            
-            else:
-                # FORMULARIO IN HOUSE
-                st.write("**🏠 Asignar a In House**")
-                
-                # Obtener locations In House
-                with st.spinner("Cargando ubicaciones In House..."):
-                    in_house_locations = get_in_house_locations()
-                
-                if not in_house_locations:
-                    st.warning("⚠️ No hay ubicaciones In House disponibles")
-                    st.info("💡 Crea una nueva ubicación In House")
-                    
-                    # Formulario para crear nueva
-                    new_in_house_name = st.text_input(
-                        "Nombre de la ubicación",
-                        placeholder="Ej: Casa Juan",
-                        key="new_in_house_name"
-                    )
-                    
-                    if st.button("Crear y Asignar", type="primary", use_container_width=True):
-                        if not new_in_house_name or new_in_house_name.strip() == "":
-                            st.error("⚠️ El nombre no puede estar vacío")
-                        else:
-                            today = date.today()
-                            with st.spinner("Creando ubicación..."):
-                                location_id = create_in_house_location(new_in_house_name, today)
-                            
-                            if location_id:
-                                success = assign_devices_in_house(
-                                    st.session_state.selected_devices,
-                                    location_id,
-                                    new_in_house_name,
-                                    today,
-                                    st.session_state.available_devices
-                                )
-                                
-                                if success:
-                                    st.session_state.selected_devices = []
-                                    st.session_state.search_completed = False
-                                    st.session_state.available_devices = []
-                                    st.rerun()
-                
-                else:
-                    # Mostrar dropdown con locations existentes
-                    location_options = {
-                        f"📍 {loc['name']} ({loc['device_count']} devices)": loc['id'] 
-                        for loc in in_house_locations
-                    }
-                    
-                    selected_location_display = st.selectbox(
-                        "Seleccionar ubicación existente",
-                        options=list(location_options.keys())
-                    )
-                    
-                    selected_location_id = location_options[selected_location_display]
-                    selected_location_name = selected_location_display.split(" (")[0].replace("📍 ", "")
-                    
-                    # Opción para crear nueva
-                    with st.expander("➕ O crear nueva ubicación In House"):
-                        new_in_house_name = st.text_input(
-                            "Nombre de la ubicación",
-                            placeholder="Ej: Casa María",
-                            key="new_in_house_name_alt"
-                        )
-                        
-                        if st.button("Crear y Asignar Nueva", type="secondary", use_container_width=True):
-                            if not new_in_house_name or new_in_house_name.strip() == "":
-                                st.error("⚠️ El nombre no puede estar vacío")
-                            else:
-                                today = date.today()
-                                with st.spinner("Creando ubicación..."):
-                                    location_id = create_in_house_location(new_in_house_name, today)
-                                
-                                if location_id:
-                                    success = assign_devices_in_house(
-                                        st.session_state.selected_devices,
-                                        location_id,
-                                        new_in_house_name,
-                                        today,
-                                        st.session_state.available_devices
-                                    )
-                                    
-                                    if success:
-                                        st.session_state.selected_devices = []
-                                        st.session_state.search_completed = False
-                                        st.session_state.available_devices = []
-                                        st.rerun()
-                    
-                    # Botón principal para asignar a existente
-                    if st.button("Asignar", type="primary", use_container_width=True):
-                        today = date.today()
-                        success = assign_devices_in_house(
-                            st.session_state.selected_devices,
-                            selected_location_id,
-                            selected_location_name,
-                            today,
-                            st.session_state.available_devices
-                        )
-                        
-                        if success:
-                            st.session_state.selected_devices = []
-                            st.session_state.search_completed = False
-                            st.session_state.available_devices = []
-                            st.rerun()
+        # Lista y formulario son fragmentos: marcar un dispositivo sólo vuelve
+        # a ejecutar la lista, no toda la página ni el formulario
+        device_list_fragment(available_devices, catalog)
+        assignment_form_fragment(catalog)
     
     else:
         st.warning("⚠️ No hay dispositivos disponibles en estas fechas")
 
 else:
-    st.info("👆 Selecciona las fechas y haz clic en 'Consultar Disponibilidad'")
\ No newline at end of file
+    st.info("👆 Selecciona las fechas y haz clic en 'Consultar Disponibilidad'")
+render_pending_jobs()
+
+# Panel de administración: métricas de las peticiones a Notion (al final, para
+# que incluya las de esta ejecución)
+start_metrics_server()
+if admin_enabled():
+    render_admin_sidebar()
+
+end_run()
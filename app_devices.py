@@ -1,7 +1,9 @@
 import streamlit as st
-import requests
 from datetime import datetime, date
 
+from notion_api import get_all_pages, notion_request, set_projection, set_token
+from notion_schema import compile_extractor, device_fields, extract_location_fields, property_names
+
 
 # Configuración de la página
 st.set_page_config(
@@ -25,94 +27,40 @@ st.markdown("---")
 
 # Configuración de Notion
 NOTION_TOKEN = "***REMOVED***2f"
-NOTION_VERSION = "2022-06-28"
 DEVICES_ID = "28d58a35e41180dd8080d1953c15ac23"
 LOCATIONS_ID = "28d58a35e41180f78235ec7f5132e6d7"
 
-headers = {
-    "Authorization": f"Bearer {NOTION_TOKEN}",
-    "Content-Type": "application/json",
-    "Notion-Version": NOTION_VERSION,
-}
+set_token(NOTION_TOKEN)
 
 
 def get_pages(database_id):
-    """Obtiene todas las páginas de una base de datos de Notion"""
-    url = f"https://api.notion.com/v1/databases/{database_id}/query"
-    payload = {"page_size": 100}
-    
-    response = requests.post(url, json=payload, headers=headers)
-    data = response.json()
-    
-    return data.get("results", [])
+    """Obtiene todas las páginas de una base de datos de Notion (sigue la paginación)"""
+    return get_all_pages(database_id)
+
+
+# Campos de Devices (en esta base de datos la relación se llama "📍 Locations_demo")
+extract_device_fields = compile_extractor(device_fields("📍 Locations_demo"))
+
+# Sólo se piden a Notion las propiedades que leen los extractores
+set_projection(DEVICES_ID, property_names(extract_device_fields))
+set_projection(LOCATIONS_ID, property_names(extract_location_fields))
 
 
 def extract_device_data(page):
     """Extrae los campos específicos de cada dispositivo"""
-    props = page["properties"]
-    device_data = {}
-    
-    # Extraer ID de la página
-    device_data["id"] = page["id"]
-    
-    # Extraer Name
-    try:
-        if props.get("Name") and props["Name"]["title"]:
-            device_data["Name"] = props["Name"]["title"][0]["text"]["content"]
-        else:
-            device_data["Name"] = "Sin nombre"
-    except:
-        device_data["Name"] = "Sin nombre"
-    
-    # Extraer Locations_demo
-    try:
-        if props.get("📍 Locations_demo") and props["📍 Locations_demo"]["relation"]:
-            location_ids = [rel["id"] for rel in props["📍 Locations_demo"]["relation"]]
-            device_data["Locations_demo_count"] = len(location_ids)
-        else:
-            device_data["Locations_demo_count"] = 0
-    except:
-        device_data["Locations_demo_count"] = 0
-    
-    # Extraer Start Date
-    try:
-        if props.get("Start Date") and props["Start Date"]["rollup"]:
-            rollup = props["Start Date"]["rollup"]
-            if rollup["type"] == "date" and rollup.get("date"):
-                device_data["Start Date"] = rollup["date"]["start"]
-            elif rollup["type"] == "array" and rollup["array"]:
-                first_item = rollup["array"][0]
-                if first_item["type"] == "date" and first_item.get("date"):
-                    device_data["Start Date"] = first_item["date"]["start"]
-                else:
-                    device_data["Start Date"] = None
-            else:
-                device_data["Start Date"] = None
-        else:
-            device_data["Start Date"] = None
-    except:
-        device_data["Start Date"] = None
-    
-    # Extraer End Date
-    try:
-        if props.get("End Date") and props["End Date"]["rollup"]:
-            rollup = props["End Date"]["rollup"]
-            if rollup["type"] == "date" and rollup.get("date"):
-                device_data["End Date"] = rollup["date"]["start"]
-            elif rollup["type"] == "array" and rollup["array"]:
-                first_item = rollup["array"][0]
-                if first_item["type"] == "date" and first_item.get("date"):
-                    device_data["End Date"] = first_item["date"]["start"]
-                else:
-                    device_data["End Date"] = None
-            else:
-                device_data["End Date"] = None
-        else:
-            device_data["End Date"] = None
-    except:
-        device_data["End Date"] = None
-    
-    return device_data
+    fields = extract_device_fields(page["properties"])
+    
+    # Start Date y End Date: primera fecha de cada rollup
+    start_dates = fields["start_dates"][0]
+    end_dates = fields["end_dates"][0]
+    
+    return {
+        "id": page["id"],
+        "Name": fields["name"] or "Sin nombre",
+        "Locations_demo_count": len(fields["location_ids"]),
+        "Start Date": start_dates[0] if start_dates else None,
+        "End Date": end_dates[0] if end_dates else None,
+    }
 
 
 def check_availability(device, start_date, end_date):
@@ -168,54 +116,23 @@ def check_availability(device, start_date, end_date):
 
 def get_in_house_locations():
     """Obtiene locations de tipo In House con contador de devices desde campo Units"""
-    url = f"https://api.notion.com/v1/databases/{LOCATIONS_ID}/query"
-    
-    payload = {
-        "filter": {
-            "property": "Type",
-            "select": {
-                "equals": "In House"
-            }
-        },
-        "page_size": 100
+    in_house_filter = {
+        "property": "Type",
+        "select": {
+            "equals": "In House"
+        }
     }
     
-    response = requests.post(url, json=payload, headers=headers)
-    data = response.json()
+    pages = get_all_pages(LOCATIONS_ID, filter=in_house_filter)
     
     locations = []
-    for page in data.get("results", []):
-        props = page["properties"]
-        
-        # Extraer Name
-        try:
-            if props.get("Name") and props["Name"]["title"]:
-                name = props["Name"]["title"][0]["text"]["content"]
-            else:
-                name = "Sin nombre"
-        except:
-            name = "Sin nombre"
-        
-        # Extraer Units (contador de devices)
-        device_count = 0
-        try:
-            if props.get("Units"):
-                # Units puede ser de tipo "rollup" o "number"
-                if props["Units"].get("rollup"):
-                    # Si es rollup
-                    rollup = props["Units"]["rollup"]
-                    if rollup["type"] == "number" and rollup.get("number") is not None:
-                        device_count = int(rollup["number"])
-                elif props["Units"].get("number") is not None:
-                    # Si es campo numérico directo
-                    device_count = int(props["Units"]["number"])
-        except:
-            device_count = 0
+    for page in pages:
+        fields = extract_location_fields(page["properties"])
         
         locations.append({
             "id": page["id"],
-            "name": name,
-            "device_count": device_count
+            "name": fields["name"] or "Sin nombre",
+            "device_count": int(fields["units"] or 0)
         })
     
     return locations
@@ -223,8 +140,6 @@ def get_in_house_locations():
 
 def create_client_location(name, start_date, end_date):
     """Crea un nuevo location tipo Client con fechas"""
-    url = "https://api.notion.com/v1/pages"
-    
     start_date_iso = start_date.isoformat()
     end_date_iso = end_date.isoformat()
     
@@ -246,7 +161,7 @@ def create_client_location(name, start_date, end_date):
         }
     }
     
-    response = requests.post(url, json=payload, headers=headers)
+    response = notion_request("POST", "pages", payload)
     
     if response.status_code == 200:
         return response.json()["id"]
@@ -257,8 +172,6 @@ def create_client_location(name, start_date, end_date):
 
 def create_in_house_location(name, start_date):
     """Crea un nuevo location tipo In House solo con Start Date"""
-    url = "https://api.notion.com/v1/pages"
-    
     start_date_iso = start_date.isoformat()
     
     payload = {
@@ -277,7 +190,7 @@ def create_in_house_location(name, start_date):
         }
     }
     
-    response = requests.post(url, json=payload, headers=headers)
+    response = notion_request("POST", "pages", payload)
     
     if response.status_code == 200:
         return response.json()["id"]
@@ -288,8 +201,6 @@ def create_in_house_location(name, start_date):
 
 def update_device_location(device_id, location_id):
     """Actualiza un dispositivo asignándole un location"""
-    url = f"https://api.notion.com/v1/pages/{device_id}"
-    
     payload = {
         "properties": {
             "📍 Locations_demo": {
@@ -298,14 +209,12 @@ def update_device_location(device_id, location_id):
         }
     }
     
-    response = requests.patch(url, json=payload, headers=headers)
+    response = notion_request("PATCH", f"pages/{device_id}", payload)
     return response.status_code == 200
 
 
 def update_location_start_date(location_id, start_date):
     """Actualiza la Start Date de un location"""
-    url = f"https://api.notion.com/v1/pages/{location_id}"
-    
     start_date_iso = start_date.isoformat()
     
     payload = {
@@ -316,7 +225,7 @@ def update_location_start_date(location_id, start_date):
         }
     }
     
-    response = requests.patch(url, json=payload, headers=headers)
+    response = notion_request("PATCH", f"pages/{location_id}", payload)
     return response.status_code == 200
 
 
@@ -335,8 +244,9 @@ def assign_devices_client(device_names, location_name, start_date, end_date, all
     if not location_id:
         return False
     
-    # Asignar devices
-    device_ids = [d["id"] for d in all_devices if d["Name"] in device_names]
+    # Asignar devices (set para que cada búsqueda por nombre sea O(1))
+    selected_names = set(device_names)
+    device_ids = [d["id"] for d in all_devices if d["Name"] in selected_names]
     success_count = 0
     
     with st.spinner(f"Asignando {len(device_ids)} dispositivos..."):
@@ -360,8 +270,9 @@ def assign_devices_in_house(device_names, location_id, location_name, start_date
         if not update_location_start_date(location_id, start_date):
             st.warning("⚠️ No se pudo actualizar la fecha de inicio del location")
     
-    # Asignar devices
-    device_ids = [d["id"] for d in all_devices if d["Name"] in device_names]
+    # Asignar devices (set para que cada búsqueda por nombre sea O(1))
+    selected_names = set(device_names)
+    device_ids = [d["id"] for d in all_devices if d["Name"] in selected_names]
     success_count = 0
     
     with st.spinner(f"Asignando {len(device_ids)} dispositivos..."):
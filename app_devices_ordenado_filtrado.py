@@ -1,8 +1,8 @@
 import streamlit as st
-import requests
 from datetime import datetime, date
-import os
-from dotenv import load_dotenv
+
+from notion_api import get_all_pages, notion_request, set_projection
+from notion_schema import compile_extractor, device_fields, extract_location_fields, property_names
 
 
 # Configuración de la página
@@ -25,114 +25,40 @@ with title_col:
 st.markdown("Consulta qué dispositivos están disponibles para alquilar en un rango de fechas")
 st.markdown("---")
 
-# Cargar variables de entorno desde el archivo .env
-load_dotenv()
-
 # Configuración de Notion
-NOTION_TOKEN = os.getenv("NOTION_TOKEN")
-NOTION_VERSION = "2022-06-28"
 DEVICES_ID = "28d58a35e41180dd8080d1953c15ac23"
 LOCATIONS_ID = "28d58a35e41180f78235ec7f5132e6d7"
 
-headers = {
-    "Authorization": f"Bearer {NOTION_TOKEN}",
-    "Content-Type": "application/json",
-    "Notion-Version": NOTION_VERSION,
-}
-
 
 def get_pages(database_id):
-    """Obtiene todas las páginas de una base de datos de Notion"""
-    url = f"https://api.notion.com/v1/databases/{database_id}/query"
-    payload = {"page_size": 100}
-    
-    response = requests.post(url, json=payload, headers=headers)
-    data = response.json()
-    
-    return data.get("results", [])
+    """Obtiene todas las páginas de una base de datos de Notion (sigue la paginación)"""
+    return get_all_pages(database_id)
+
+
+# Campos de Devices (en esta base de datos la relación se llama "📍 Locations_demo")
+extract_device_fields = compile_extractor(device_fields("📍 Locations_demo"))
+
+# Sólo se piden a Notion las propiedades que leen los extractores
+set_projection(DEVICES_ID, property_names(extract_device_fields))
+set_projection(LOCATIONS_ID, property_names(extract_location_fields))
 
 
 def extract_device_data(page):
     """Extrae los campos específicos de cada dispositivo"""
-    props = page["properties"]
-    device_data = {}
-    
-    # Extraer ID de la página
-    device_data["id"] = page["id"]
-    
-    # Extraer Name
-    try:
-        if props.get("Name") and props["Name"]["title"]:
-            device_data["Name"] = props["Name"]["title"][0]["text"]["content"]
-        else:
-            device_data["Name"] = "Sin nombre"
-    except:
-        device_data["Name"] = "Sin nombre"
-    
-    # ========================================
-    # 🔹 CORREGIDO: Extraer Tags (campo SELECT, no multi_select)
-    # ========================================
-    # Tags es un campo "select" que contiene UN SOLO VALOR
-    # Ejemplo: "Ultra" o "Neo 4"
-    try:
-        if props.get("Tags") and props["Tags"]["select"]:
-            # Extraemos el nombre del tag seleccionado
-            device_data["Tags"] = props["Tags"]["select"]["name"]
-        else:
-            device_data["Tags"] = "Sin tag"
-    except:
-        device_data["Tags"] = "Sin tag"
-    # ========================================
-    
-    # Extraer Locations_demo
-    try:
-        if props.get("📍 Locations_demo") and props["📍 Locations_demo"]["relation"]:
-            location_ids = [rel["id"] for rel in props["📍 Locations_demo"]["relation"]]
-            device_data["Locations_demo_count"] = len(location_ids)
-        else:
-            device_data["Locations_demo_count"] = 0
-    except:
-        device_data["Locations_demo_count"] = 0
-    
-    # Extraer Start Date
-    try:
-        if props.get("Start Date") and props["Start Date"]["rollup"]:
-            rollup = props["Start Date"]["rollup"]
-            if rollup["type"] == "date" and rollup.get("date"):
-                device_data["Start Date"] = rollup["date"]["start"]
-            elif rollup["type"] == "array" and rollup["array"]:
-                first_item = rollup["array"][0]
-                if first_item["type"] == "date" and first_item.get("date"):
-                    device_data["Start Date"] = first_item["date"]["start"]
-                else:
-                    device_data["Start Date"] = None
-            else:
-                device_data["Start Date"] = None
-        else:
-            device_data["Start Date"] = None
-    except:
-        device_data["Start Date"] = None
-    
-    # Extraer End Date
-    try:
-        if props.get("End Date") and props["End Date"]["rollup"]:
-            rollup = props["End Date"]["rollup"]
-            if rollup["type"] == "date" and rollup.get("date"):
-                device_data["End Date"] = rollup["date"]["start"]
-            elif rollup["type"] == "array" and rollup["array"]:
-                first_item = rollup["array"][0]
-                if first_item["type"] == "date" and first_item.get("date"):
-                    device_data["End Date"] = first_item["date"]["start"]
-                else:
-                    device_data["End Date"] = None
-            else:
-                device_data["End Date"] = None
-        else:
-            device_data["End Date"] = None
-    except:
-        device_data["End Date"] = None
-    
-    return device_data
+    fields = extract_device_fields(page["properties"])
+    
+    # Start Date y End Date: primera fecha de cada rollup
+    start_dates = fields["start_dates"][0]
+    end_dates = fields["end_dates"][0]
+    
+    return {
+        "id": page["id"],
+        "Name": fields["name"] or "Sin nombre",
+        "Tags": fields["tag"] or "Sin tag",
+        "Locations_demo_count": len(fields["location_ids"]),
+        "Start Date": start_dates[0] if start_dates else None,
+        "End Date": end_dates[0] if end_dates else None,
+    }
 
 
 def check_availability(device, start_date, end_date):
@@ -188,47 +114,23 @@ def check_availability(device, start_date, end_date):
 
 def get_in_house_locations():
     """Obtiene locations de tipo In House con contador de devices desde campo Units"""
-    url = f"https://api.notion.com/v1/databases/{LOCATIONS_ID}/query"
-    
-    payload = {
-        "filter": {
-            "property": "Type",
-            "select": {
-                "equals": "In House"
-            }
-        },
-        "page_size": 100
+    in_house_filter = {
+        "property": "Type",
+        "select": {
+            "equals": "In House"
+        }
     }
     
-    response = requests.post(url, json=payload, headers=headers)
-    data = response.json()
+    pages = get_all_pages(LOCATIONS_ID, filter=in_house_filter)
     
     locations = []
-    for page in data.get("results", []):
-        props = page["properties"]
-        
-        # Extraer Name
-        try:
-            if props.get("Name") and props["Name"]["title"]:
-                name = props["Name"]["title"][0]["text"]["content"]
-            else:
-                name = "Sin nombre"
-        except:
-            name = "Sin nombre"
-        
-        # Extraer Units como device_count
-        try:
-            if props.get("Units") and props["Units"]["number"] is not None:
-                device_count = props["Units"]["number"]
-            else:
-                device_count = 0
-        except:
-            device_count = 0
+    for page in pages:
+        fields = extract_location_fields(page["properties"])
         
         locations.append({
             "id": page["id"],
-            "name": name,
-            "device_count": device_count
+            "name": fields["name"] or "Sin nombre",
+            "device_count": fields["units"] or 0
         })
     
     return locations
@@ -236,8 +138,6 @@ def get_in_house_locations():
 
 def create_in_house_location(name, start_date):
     """Crea una nueva location In House en Notion"""
-    url = "https://api.notion.com/v1/pages"
-    
     payload = {
         "parent": {"database_id": LOCATIONS_ID},
         "properties": {
@@ -263,7 +163,7 @@ def create_in_house_location(name, start_date):
         }
     }
     
-    response = requests.post(url, json=payload, headers=headers)
+    response = notion_request("POST", "pages", payload)
     
     if response.status_code == 200:
         data = response.json()
@@ -282,8 +182,6 @@ def assign_devices_client(device_names, client_name, start_date, end_date, avail
         return False
     
     # 1. Crear la location Client
-    url_location = "https://api.notion.com/v1/pages"
-    
     payload_location = {
         "parent": {"database_id": LOCATIONS_ID},
         "properties": {
@@ -315,7 +213,7 @@ def assign_devices_client(device_names, client_name, start_date, end_date, avail
     }
     
     with st.spinner(f"Creando destino '{client_name}'..."):
-        response_location = requests.post(url_location, json=payload_location, headers=headers)
+        response_location = notion_request("POST", "pages", payload_location)
     
     if response_location.status_code != 200:
         st.error(f"❌ Error al crear el destino: {response_location.text}")
@@ -328,7 +226,6 @@ def assign_devices_client(device_names, client_name, start_date, end_date, avail
     
     # 2. Asignar cada dispositivo a esta location
     success_count = 0
-    url_patch = "https://api.notion.com/v1/pages/"
     
     progress_bar = st.progress(0)
     total = len(device_names)
@@ -355,7 +252,7 @@ def assign_devices_client(device_names, client_name, start_date, end_date, avail
             }
         }
         
-        response_device = requests.patch(f"{url_patch}{device_id}", json=payload_device, headers=headers)
+        response_device = notion_request("PATCH", f"pages/{device_id}", payload_device)
         
         if response_device.status_code == 200:
             success_count += 1
@@ -381,7 +278,6 @@ def assign_devices_in_house(device_names, location_id, location_name, start_date
     """Asigna dispositivos a una ubicación In House existente"""
     
     success_count = 0
-    url_patch = "https://api.notion.com/v1/pages/"
     
     progress_bar = st.progress(0)
     total = len(device_names)
@@ -408,7 +304,7 @@ def assign_devices_in_house(device_names, location_id, location_name, start_date
             }
         }
         
-        response_device = requests.patch(f"{url_patch}{device_id}", json=payload_device, headers=headers)
+        response_device = notion_request("PATCH", f"pages/{device_id}", payload_device)
         
         if response_device.status_code == 200:
             success_count += 1
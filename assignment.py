@@ -0,0 +1,211 @@
+"""Asignación masiva de dispositivos a una ubicación de Notion (y lectura de las páginas afectadas)"""
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from notion_api import NotionAPIError, complete_page, get_page, notion_request
+
+
+# Número máximo de PATCH simultáneos contra Notion
+MAX_CONCURRENCY = int(os.getenv("NOTION_ASSIGN_CONCURRENCY", "3"))
+
+# Resultado de asignar un dispositivo.
+# - device_id: id de la página del dispositivo
+# - ok: True si Notion aceptó el cambio
+# - status_code: código HTTP (None si no hubo respuesta)
+# - error: texto del error (None si fue bien)
+AssignmentResult = namedtuple("AssignmentResult", ["device_id", "ok", "status_code", "error"])
+
+
+class AssignmentReport:
+    """Resumen de una asignación masiva: qué dispositivos fueron bien y cuáles fallaron"""
+
+    def __init__(self, location_id):
+        self.location_id = location_id
+        self.succeeded = []
+        self.failed = []
+
+    def add(self, result):
+        if result.ok:
+            self.succeeded.append(result.device_id)
+        else:
+            self.failed.append(result)
+
+    @property
+    def total(self):
+        return len(self.succeeded) + len(self.failed)
+
+    @property
+    def all_ok(self):
+        return not self.failed
+
+
+def _patch_relation(device_id, location_ids, property_name):
+    """Sustituye la relación de un dispositivo por las ubicaciones indicadas"""
+    payload = {
+        "properties": {
+            property_name: {
+                "relation": [
+                    {"id": location_id} for location_id in location_ids
+                ]
+            }
+        }
+    }
+
+    try:
+        response = notion_request("PATCH", f"pages/{device_id}", payload)
+    except requests.RequestException as error:
+        return AssignmentResult(device_id, False, None, str(error))
+
+    if response.status_code == 200:
+        return AssignmentResult(device_id, True, 200, None)
+    return AssignmentResult(device_id, False, response.status_code, response.text)
+
+
+def _fetch_page(page_id, database_id):
+    try:
+        page = complete_page(get_page(page_id, database_id))
+    except (NotionAPIError, requests.RequestException) as error:
+        return page_id, None, str(error)
+    if page.get("archived") or page.get("in_trash"):
+        return page_id, None, "archivado"
+    return page_id, page, None
+
+
+def fetch_pages(page_ids, database_id=None, max_workers=None):
+    """
+    Lee las páginas indicadas en paralelo, por id (sin consultar toda la base de datos)
+
+    Devuelve (páginas {id: página}, errores {id: texto}). Las páginas
+    archivadas cuentan como error. Las relaciones de más de 25 elementos se
+    completan (notion_api.complete_page).
+    """
+    pages = {}
+    errors = {}
+    if not page_ids:
+        return pages, errors
+
+    workers = min(max_workers or MAX_CONCURRENCY, len(page_ids))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_fetch_page, page_id, database_id) for page_id in page_ids]
+        for future in as_completed(futures):
+            page_id, page, error = future.result()
+            if error is None:
+                pages[page_id] = page
+            else:
+                errors[page_id] = error
+
+    return pages, errors
+
+
+def iter_relation_updates(relations, property_name="Location", max_workers=None):
+    """
+    Cambia la relación de cada dispositivo en paralelo (como máximo max_workers a la vez)
+
+    relations: {device_id: [location_id, ...]}; una lista vacía deja el
+    dispositivo sin ubicación. Es un generador: devuelve cada
+    AssignmentResult en cuanto termina, en el orden en que van acabando.
+    """
+    if not relations:
+        return
+
+    workers = min(max_workers or MAX_CONCURRENCY, len(relations))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_patch_relation, device_id, location_ids, property_name)
+            for device_id, location_ids in relations.items()
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def _added_relation(location_ids, location_id):
+    """Relación tras añadir la location a las que ya tiene el dispositivo (sin repetirla)"""
+    location_ids = list(location_ids or ())
+    if location_id not in location_ids:
+        location_ids.append(location_id)
+    return location_ids
+
+
+def relation_ids(page, property_name="Location"):
+    """Ids de la relación de una página (completa si viene de fetch_pages)"""
+    prop = page.get("properties", {}).get(property_name) or {}
+    return [related["id"] for related in prop.get("relation") or []]
+
+
+def read_relations(device_ids, property_name="Location", max_workers=None):
+    """
+    Relación actual y completa de cada dispositivo (GET por id en paralelo)
+
+    Devuelve (relaciones {device_id: [location_id, ...]}, errores {device_id: texto}).
+    """
+    pages, errors = fetch_pages(device_ids, max_workers=max_workers)
+    relations = {device_id: relation_ids(page, property_name) for device_id, page in pages.items()}
+    return relations, errors
+
+
+def iter_assignments(device_ids, location_id, property_name="Location", max_workers=None, current=None):
+    """
+    Asigna los dispositivos en paralelo (como máximo max_workers a la vez)
+
+    El PATCH sustituye la relación entera, así que se envía la que ya tiene
+    cada dispositivo más la nueva location, para no borrar sus otras reservas.
+    current: {device_id: [location_id, ...]} con la relación completa recién
+    leída; sin current se lee aquí. Los dispositivos cuya relación no se
+    conoce no se tocan y salen como fallidos (sin código HTTP).
+
+    Es un generador: devuelve cada AssignmentResult en cuanto termina, en el
+    orden en que van acabando, para poder ir actualizando la barra de progreso.
+    """
+    if current is None:
+        current, errors = read_relations(device_ids, property_name, max_workers)
+    else:
+        errors = {device_id: "relación no leída" for device_id in device_ids if device_id not in current}
+
+    for device_id, error in errors.items():
+        yield AssignmentResult(device_id, False, None, error)
+
+    relations = {
+        device_id: _added_relation(current[device_id], location_id)
+        for device_id in device_ids if device_id in current
+    }
+    yield from iter_relation_updates(relations, property_name, max_workers)
+
+
+def iter_unassignments(device_ids, location_id, property_name="Location", max_workers=None):
+    """
+    Quita la location de la relación actual de cada dispositivo (al deshacer una asignación)
+
+    Se relee la relación y sólo se quita esa location: las reservas hechas
+    después por otras personas se conservan. Los que ya no la tienen no se
+    tocan y cuentan como bien. Es un generador, como iter_assignments.
+    """
+    current, errors = read_relations(device_ids, property_name, max_workers)
+
+    for device_id, error in errors.items():
+        yield AssignmentResult(device_id, False, None, error)
+
+    relations = {}
+    for device_id, location_ids in current.items():
+        if location_id in location_ids:
+            relations[device_id] = [related for related in location_ids if related != location_id]
+        else:
+            yield AssignmentResult(device_id, True, None, None)
+    yield from iter_relation_updates(relations, property_name, max_workers)
+
+
+def assign_devices(device_ids, location_id, property_name="Location", max_workers=None, on_result=None,
+                   current=None):
+    """Asigna los dispositivos y devuelve un AssignmentReport con el resultado"""
+    report = AssignmentReport(location_id)
+
+    for result in iter_assignments(device_ids, location_id, property_name, max_workers, current):
+        report.add(result)
+        if on_result:
+            on_result(result, report)
+
+    return report
@@ -0,0 +1,364 @@
+"""
+Diario de las asignaciones en bloque: reanudar, reintentar los fallidos o deshacer
+
+Cada asignación es un trabajo que deja en un fichero JSONL (sólo se añaden
+líneas) un suceso por cada paso: trabajo creado (con la relación que tenía
+cada dispositivo), location creada, dispositivo asignado o fallido, fin de
+la pasada, dispositivo restaurado... Releyendo el diario se sabe en qué
+quedó cada trabajo aunque la sesión de Streamlit muriera a mitad.
+
+    python -m assignment_jobs list
+    python -m assignment_jobs resume <trabajo>
+    python -m assignment_jobs retry <trabajo>
+    python -m assignment_jobs rollback <trabajo>
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import requests
+
+from assignment import AssignmentReport, AssignmentResult, iter_assignments, iter_unassignments
+from notion_api import notion_request
+
+
+JOURNAL_PATH = os.getenv(
+    "NOTION_JOURNAL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "assignment_jobs.jsonl"),
+)
+
+# Un trabajo sin terminar cuyo último suceso es más antiguo que esto se da por
+# interrumpido (si no, puede que otra sesión lo esté ejecutando todavía)
+STALE_SECONDS = float(os.getenv("NOTION_JOURNAL_STALE", "60"))
+
+_lock = threading.Lock()
+# ruta -> ((tamaño, mtime), trabajos): el diario sólo se relee si ha cambiado
+_loaded = {}
+
+
+class Job:
+    """Estado de un trabajo, reconstruido a partir de sus sucesos"""
+
+    def __init__(self, job_id, created):
+        self.id = job_id
+        self.created = created["ts"]
+        self.updated = created["ts"]
+        self.location_name = created["location_name"]
+        self.location_type = created["location_type"]
+        self.location_id = created.get("location_id")
+        self.location_created = False
+        self.location_archived = False
+        self.start = created.get("start")
+        self.end = created.get("end")
+        self.device_ids = list(created["device_ids"])
+        # Relación que tenía cada dispositivo antes del trabajo (sólo informativa:
+        # al deshacer se quita la location del trabajo de la relación actual)
+        self.previous = created.get("previous", {})
+        self.assigned = set()
+        # device_id -> (código HTTP o None si no hubo respuesta, error)
+        self.failed = {}
+        self.restored = set()
+        self.finished = False
+        self.rolled_back = False
+        self.cancelled = False
+
+    def apply(self, event):
+        self.updated = event["ts"]
+        kind = event["event"]
+        if kind == "location_created":
+            self.location_id = event["location_id"]
+            self.location_created = True
+        elif kind == "run":
+            self.finished = False
+        elif kind == "assigned":
+            self.assigned.add(event["device_id"])
+            self.failed.pop(event["device_id"], None)
+        elif kind == "failed":
+            self.failed[event["device_id"]] = (event.get("status"), event.get("error"))
+        elif kind == "finished":
+            self.finished = True
+        elif kind == "restored":
+            self.restored.add(event["device_id"])
+            self.assigned.discard(event["device_id"])
+        elif kind == "location_archived":
+            self.location_archived = True
+        elif kind == "rolled_back":
+            self.rolled_back = True
+        elif kind == "cancelled":
+            self.cancelled = True
+
+    @property
+    def pending(self):
+        """Dispositivos que no se llegaron a intentar"""
+        return [
+            device_id for device_id in self.device_ids
+            if device_id not in self.assigned and device_id not in self.failed
+            and device_id not in self.restored
+        ]
+
+    @property
+    def status(self):
+        if self.cancelled:
+            return "cancelled"
+        if self.rolled_back:
+            return "rolled_back"
+        if not self.finished:
+            return "interrupted"
+        if self.failed or self.pending:
+            return "failed"
+        return "done"
+
+    def is_open(self, now=None):
+        """Si hay que ofrecer reanudarlo, reintentarlo o deshacerlo"""
+        status = self.status
+        if status == "failed":
+            return True
+        if status != "interrupted":
+            return False
+        # Un trabajo sin terminar puede estar ejecutándose en otra sesión
+        now = now or datetime.now(timezone.utc)
+        return (now - datetime.fromisoformat(self.updated)).total_seconds() > STALE_SECONDS
+
+
+class AssignmentJournal:
+    """Diario JSONL compartido por todas las sesiones del proceso"""
+
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+
+    def _append(self, job_id, event, **data):
+        record = {
+            "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "job": job_id,
+            "event": event,
+            **data,
+        }
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with _lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(line)
+                file.flush()
+                os.fsync(file.fileno())
+
+    def create(self, location_name, location_type, device_ids, previous,
+               start=None, end=None, location_id=None):
+        """
+        Crea un trabajo y devuelve su id
+
+        previous: {device_id: [location_ids]} con la relación actual de cada
+        dispositivo. location_id sólo si la location ya existía.
+        """
+        job_id = uuid.uuid4().hex[:12]
+        self._append(
+            job_id, "created",
+            location_name=location_name,
+            location_type=location_type,
+            location_id=location_id,
+            start=start.isoformat() if start else None,
+            end=end.isoformat() if end else None,
+            device_ids=list(device_ids),
+            previous={device_id: list(previous.get(device_id, ())) for device_id in device_ids},
+        )
+        return job_id
+
+    def location_created(self, job_id, location_id):
+        self._append(job_id, "location_created", location_id=location_id)
+
+    def record(self, job_id, event, **data):
+        self._append(job_id, event, **data)
+
+    def record_result(self, job_id, result):
+        """Apunta el resultado (AssignmentResult) de asignar un dispositivo"""
+        if result.ok:
+            self._append(job_id, "assigned", device_id=result.device_id)
+        else:
+            self._append(
+                job_id, "failed",
+                device_id=result.device_id, status=result.status_code, error=result.error,
+            )
+
+    def jobs(self):
+        """Todos los trabajos {id: Job}, en el orden en que se crearon"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return {}
+        signature = (stat.st_size, stat.st_mtime_ns)
+        cached = _loaded.get(self.path)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+        jobs = {}
+        with open(self.path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # Línea a medias de un proceso que murió escribiendo
+                    continue
+                if event["event"] == "created":
+                    jobs[event["job"]] = Job(event["job"], event)
+                elif event["job"] in jobs:
+                    jobs[event["job"]].apply(event)
+
+        _loaded[self.path] = (signature, jobs)
+        return jobs
+
+    def get(self, job_id):
+        return self.jobs().get(job_id)
+
+    def open_jobs(self):
+        """Trabajos interrumpidos o con fallos, del más reciente al más antiguo"""
+        now = datetime.now(timezone.utc)
+        return [job for job in reversed(self.jobs().values()) if job.is_open(now)]
+
+
+def run_job(journal, job_id, device_ids, location_id, on_result=None, current=None):
+    """
+    Asigna los dispositivos a la location apuntando cada resultado en el diario
+
+    A cada dispositivo se le añade la location a su relación actual, sin
+    borrar sus otras reservas. current: relación completa recién leída
+    {device_id: [location_id, ...]}; sin ella se vuelve a leer de Notion
+    (nunca se usa job.previous: puede tener horas y borraría las reservas
+    hechas desde entonces). Devuelve un AssignmentReport, igual que
+    assignment.assign_devices.
+    """
+    report = AssignmentReport(location_id)
+    journal.record(job_id, "run", device_ids=list(device_ids))
+
+    for result in iter_assignments(list(device_ids), location_id, current=current):
+        journal.record_result(job_id, result)
+        report.add(result)
+        if on_result:
+            on_result(result, report)
+
+    journal.record(job_id, "finished")
+    return report
+
+
+def resume_job(journal, job, on_result=None):
+    """Asigna los dispositivos que no se llegaron a intentar (releyendo su relación)"""
+    if not job.location_id:
+        raise ValueError("El trabajo no llegó a crear la location: no se puede reanudar")
+    return run_job(journal, job.id, job.pending, job.location_id, on_result)
+
+
+def retry_failed(journal, job, on_result=None):
+    """Vuelve a intentar sólo los dispositivos que fallaron (releyendo su relación)"""
+    return run_job(journal, job.id, list(job.failed), job.location_id, on_result)
+
+
+def rollback_job(journal, job, on_result=None):
+    """
+    Quita la location del trabajo a los dispositivos que se le asignaron
+
+    Se tocan sólo los asignados y los que fallaron sin respuesta (el PATCH
+    pudo llegar a aplicarse), y a cada uno sólo se le quita esa location de
+    su relación actual: las reservas que haya hecho otra persona después se
+    conservan. Si el trabajo no llegó a tener location no hay nada que
+    deshacer en los dispositivos. Si todo va bien y el trabajo creó la
+    location, se archiva.
+    """
+    report = AssignmentReport(job.location_id)
+    if not job.location_created and not job.location_id:
+        journal.record(job.id, "rolled_back")
+        return report
+
+    unanswered = {device_id for device_id, (status, _) in job.failed.items() if status is None}
+    device_ids = [
+        device_id for device_id in job.device_ids
+        if (device_id in job.assigned or device_id in unanswered) and device_id not in job.restored
+    ]
+
+    for result in iter_unassignments(device_ids, job.location_id):
+        if result.ok:
+            journal.record(job.id, "restored", device_id=result.device_id)
+        else:
+            journal.record(job.id, "restore_failed", device_id=result.device_id, error=result.error)
+        report.add(result)
+        if on_result:
+            on_result(result, report)
+
+    if not report.all_ok:
+        return report
+
+    if job.location_created and job.location_id and not job.location_archived:
+        result = archive_location(job.location_id)
+        if not result.ok:
+            journal.record(job.id, "archive_failed", error=result.error)
+            report.add(result)
+            return report
+        journal.record(job.id, "location_archived")
+
+    journal.record(job.id, "rolled_back")
+    return report
+
+
+def archive_location(location_id):
+    """Archiva (envía a la papelera) una location creada por un trabajo"""
+    try:
+        response = notion_request("PATCH", f"pages/{location_id}", {"archived": True})
+    except requests.RequestException as error:
+        return AssignmentResult(location_id, False, None, str(error))
+    if response.status_code == 200:
+        return AssignmentResult(location_id, True, 200, None)
+    return AssignmentResult(location_id, False, response.status_code, response.text)
+
+
+def cancel_job(journal, job):
+    """Deja de ofrecer un trabajo (sin tocar Notion)"""
+    journal.record(job.id, "cancelled")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trabajos de asignación en bloque")
+    parser.add_argument("action", choices=["list", "resume", "retry", "rollback", "cancel"])
+    parser.add_argument("job", nargs="?", help="id del trabajo")
+    parser.add_argument("--all", action="store_true", help="listar también los terminados")
+    parser.add_argument("--journal", default=JOURNAL_PATH)
+    args = parser.parse_args(argv)
+
+    journal = AssignmentJournal(args.journal)
+
+    if args.action == "list":
+        jobs = reversed(journal.jobs().values()) if args.all else journal.open_jobs()
+        for job in jobs:
+            print(
+                f"{job.id}  {job.created[:19]}  {job.status:<12} {job.location_type:<9} "
+                f"{job.location_name}: {len(job.assigned)} asignados, {len(job.failed)} fallidos, "
+                f"{len(job.pending)} sin intentar"
+            )
+        return 0
+
+    job = journal.get(args.job) if args.job else None
+    if job is None:
+        print(f"No existe el trabajo '{args.job}'", file=sys.stderr)
+        return 1
+
+    started = time.perf_counter()
+    if args.action == "cancel":
+        cancel_job(journal, job)
+        return 0
+    if args.action == "resume":
+        report = resume_job(journal, job)
+    elif args.action == "retry":
+        report = retry_failed(journal, job)
+    else:
+        report = rollback_job(journal, job)
+
+    print(f"{len(report.succeeded)} bien, {len(report.failed)} con error "
+          f"({time.perf_counter() - started:.1f} s)")
+    for result in report.failed:
+        print(f"  {result.device_id}: {result.error}", file=sys.stderr)
+    return 0 if report.all_ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
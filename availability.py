@@ -0,0 +1,165 @@
+"""Índice de disponibilidad de dispositivos por rango de fechas"""
+from bisect import bisect_right
+from datetime import date
+
+import numpy as np
+
+
+# Reservas abiertas: sin fecha de inicio empiezan "siempre", sin fecha de fin no acaban nunca
+OPEN_START = date.min.toordinal()
+OPEN_END = date.max.toordinal()
+
+
+def booking_intervals(device):
+    """
+    Devuelve los intervalos (inicio, fin) en que el dispositivo está ocupado
+
+    Una lista vacía significa que está libre. Mismas reglas que check_availability,
+    aplicadas a cada reserva del dispositivo:
+    - Sin ubicación: libre
+    - Con ubicación pero sin fechas: ocupado indefinidamente
+    - Sólo inicio / sólo fin: ocupado desde el inicio / hasta el fin
+    - Fechas que no se pueden leer: ocupado (se leen como reserva sin fechas)
+    """
+    if device.locations_count == 0:
+        return []
+
+    # Con ubicación pero sin reservas leídas = ocupado indefinidamente
+    if not device.bookings:
+        return [(OPEN_START, OPEN_END)]
+
+    return [
+        (
+            booking.start.toordinal() if booking.start else OPEN_START,
+            booking.end.toordinal() if booking.end else OPEN_END,
+        )
+        for booking in device.bookings
+    ]
+
+
+class AvailabilityIndex:
+    """
+    Índice de intervalos ocupados para responder "¿qué dispositivos están libres en [inicio, fin]?"
+
+    Se construye una vez por cada descarga de datos con todas las reservas de
+    cada dispositivo (puede haber varias por dispositivo). Los intervalos se ordenan
+    por fecha de inicio y se guarda en un árbol de segmentos el fin máximo de
+    cada tramo, así una consulta sólo recorre los intervalos que solapan
+    (O(log n + k)) en lugar de comprobar todos los dispositivos.
+    """
+
+    def __init__(self, devices):
+        self.devices = list(devices)
+
+        intervals = []
+        for position, device in enumerate(self.devices):
+            for start, end in booking_intervals(device):
+                intervals.append((start, end, position))
+        intervals.sort()
+
+        self.starts = [interval[0] for interval in intervals]
+        self.positions = [interval[2] for interval in intervals]
+
+        # Árbol de segmentos (en un array) con el fin máximo de cada tramo
+        size = 1
+        while size < len(intervals):
+            size *= 2
+        self.size = size
+        self.max_end = [OPEN_START - 1] * (2 * size)
+        for i, interval in enumerate(intervals):
+            self.max_end[size + i] = interval[1]
+        for node in range(size - 1, 0, -1):
+            self.max_end[node] = max(self.max_end[2 * node], self.max_end[2 * node + 1])
+
+    def busy_positions(self, start_date, end_date):
+        """Posiciones (en self.devices) de los dispositivos ocupados en algún día del rango"""
+        query_start = start_date.toordinal()
+        query_end = end_date.toordinal()
+
+        # Sólo pueden solapar los intervalos que empiezan antes del fin del rango
+        limit = bisect_right(self.starts, query_end)
+        busy = set()
+        if limit == 0:
+            return busy
+
+        # Recorremos el árbol descartando los tramos cuyo fin máximo es anterior al inicio
+        stack = [(1, 0, self.size)]
+        while stack:
+            node, lo, hi = stack.pop()
+            if lo >= limit or self.max_end[node] < query_start:
+                continue
+            if hi - lo == 1:
+                busy.add(self.positions[lo])
+                continue
+            mid = (lo + hi) // 2
+            stack.append((2 * node, lo, mid))
+            stack.append((2 * node + 1, mid, hi))
+
+        return busy
+
+    def available(self, start_date, end_date):
+        """Dispositivos libres durante todo el rango, en el orden original"""
+        busy = self.busy_positions(start_date, end_date)
+        return [device for position, device in enumerate(self.devices) if position not in busy]
+
+
+class VectorAvailability:
+    """
+    Motor de disponibilidad vectorizado con NumPy
+
+    Guarda todas las reservas como arrays datetime64[D] (con fechas centinela
+    para los extremos abiertos) y evalúa el solapamiento de todas las reservas
+    a la vez, también para muchos rangos de fechas en una sola pasada
+    (calendarios, consultas por lotes).
+    """
+
+    def __init__(self, devices):
+        self.devices = list(devices)
+
+        owners = []
+        starts = []
+        ends = []
+        for position, device in enumerate(self.devices):
+            for start, end in booking_intervals(device):
+                owners.append(position)
+                starts.append(start)
+                ends.append(end)
+
+        # Ordinales de date -> datetime64[D] (días desde 1970-01-01)
+        epoch = date(1970, 1, 1).toordinal()
+        self.owners = np.array(owners, dtype=np.intp)
+        self.starts = (np.array(starts, dtype=np.int64) - epoch).astype("datetime64[D]")
+        self.ends = (np.array(ends, dtype=np.int64) - epoch).astype("datetime64[D]")
+
+        # Primer índice de reserva de cada dispositivo con reservas (owners ya está ordenado)
+        self.booked_devices, self.first_booking = np.unique(self.owners, return_index=True)
+
+    def free_matrix(self, windows):
+        """
+        Matriz (rangos x dispositivos) con True donde el dispositivo está libre todo el rango
+
+        windows: lista de tuplas (fecha_inicio, fecha_fin)
+        """
+        free = np.ones((len(windows), len(self.devices)), dtype=bool)
+        if not windows or not len(self.owners):
+            return free
+
+        window_starts = np.array([w[0] for w in windows], dtype="datetime64[D]")[:, None]
+        window_ends = np.array([w[1] for w in windows], dtype="datetime64[D]")[:, None]
+
+        # Solapamiento de cada reserva con cada rango: (rangos x reservas)
+        overlaps = (self.starts[None, :] <= window_ends) & (self.ends[None, :] >= window_starts)
+
+        # Un dispositivo está ocupado si alguna de sus reservas solapa
+        busy = np.logical_or.reduceat(overlaps, self.first_booking, axis=1)
+        free[:, self.booked_devices] = ~busy
+        return free
+
+    def free_mask(self, start_date, end_date):
+        """Array de booleanos con True para los dispositivos libres en el rango"""
+        return self.free_matrix([(start_date, end_date)])[0]
+
+    def available(self, start_date, end_date):
+        """Dispositivos libres durante todo el rango, en el orden original"""
+        mask = self.free_mask(start_date, end_date)
+        return [device for device, free in zip(self.devices, mask) if free]
@@ -0,0 +1,7 @@
+"""
+Benchmarks de las apps contra un servidor local que imita la API de Notion
+
+    python -m bench.run --sizes 100 1000 10000
+
+No necesita red ni token: el servidor (fake_notion) y los datos (fleet) son locales.
+"""
@@ -0,0 +1,464 @@
+"""
+Servidor HTTP local que imita la parte de la API de Notion que usan las apps
+
+- POST /v1/databases/{id}/query: paginación con cursores y page_size, filtros
+  de last_edited_time, select, relation y date (con and/or)
+- POST /v1/pages, PATCH /v1/pages/{id} (también archived), GET /v1/pages/{id}
+- GET /v1/databases/{id}: esquema con los ids de las propiedades, y
+  filter_properties en las consultas y al leer una página
+- GET /v1/pages/{id}/properties/{property_id}: valores de una propiedad
+  paginados; en las páginas las relaciones y rollups se cortan a 25
+  elementos (la relación marca has_more), como en Notion
+- Límite de peticiones opcional: responde 429 con Retry-After como Notion
+
+Los rollups de fechas (Start Date / End Date de Devices) se recalculan al
+cambiar la relación, igual que en Notion.
+"""
+import json
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+
+# Elementos de una relación o rollup que Notion incluye en una página
+PROPERTY_ITEMS_LIMIT = 25
+
+
+def now_iso():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def _date_start(prop):
+    """Fecha de inicio de una propiedad date, o lista de fechas de un rollup"""
+    if prop.get("type") == "rollup":
+        rollup = prop.get("rollup") or {}
+        if rollup.get("type") == "date":
+            return [(rollup.get("date") or {}).get("start")]
+        return [(item.get("date") or {}).get("start") for item in rollup.get("array", [])]
+    return [(prop.get("date") or {}).get("start")]
+
+
+def _match_date(value, condition):
+    """Condición de fecha de Notion (before, after, is_empty...) sobre una fecha"""
+    for operator, operand in condition.items():
+        if operator == "is_empty":
+            return not value
+        if operator == "is_not_empty":
+            return bool(value)
+        if not value:
+            return False
+        value = value[:10]
+        operand = operand[:10]
+        if operator == "equals":
+            return value == operand
+        if operator == "before":
+            return value < operand
+        if operator == "after":
+            return value > operand
+        if operator == "on_or_before":
+            return value <= operand
+        if operator == "on_or_after":
+            return value >= operand
+    return True
+
+
+def matches(page, condition):
+    """Evalúa un filtro de Notion sobre una página (condiciones no soportadas = se cumplen)"""
+    if not condition:
+        return True
+    if "and" in condition:
+        return all(matches(page, part) for part in condition["and"])
+    if "or" in condition:
+        return any(matches(page, part) for part in condition["or"])
+
+    if condition.get("timestamp") == "last_edited_time":
+        rule = condition["last_edited_time"]
+        edited = page.get("last_edited_time", "")
+        if "on_or_after" in rule:
+            return edited >= rule["on_or_after"]
+        if "after" in rule:
+            return edited > rule["after"]
+        return True
+
+    prop = page["properties"].get(condition.get("property"))
+    if prop is None:
+        return False
+
+    if "select" in condition:
+        option = (prop.get("select") or {}).get("name")
+        rule = condition["select"]
+        if "equals" in rule:
+            return option == rule["equals"]
+        if "does_not_equal" in rule:
+            return option != rule["does_not_equal"]
+        if "is_empty" in rule:
+            return option is None
+        return True
+
+    if "relation" in condition:
+        relations = prop.get("relation") or []
+        rule = condition["relation"]
+        if "is_empty" in rule:
+            return not relations
+        if "is_not_empty" in rule:
+            return bool(relations)
+        if "contains" in rule:
+            return any(relation["id"] == rule["contains"] for relation in relations)
+        return True
+
+    if "date" in condition:
+        values = _date_start(prop)
+        return _match_date(values[0] if values else None, condition["date"])
+
+    if "rollup" in condition:
+        values = _date_start(prop)
+        rule = condition["rollup"]
+        for quantifier in ("any", "every", "none"):
+            if quantifier in rule and "date" in rule[quantifier]:
+                results = [_match_date(value, rule[quantifier]["date"]) for value in values]
+                if quantifier == "any":
+                    return any(results)
+                if quantifier == "every":
+                    return all(results)
+                return not any(results)
+        return True
+
+    return True
+
+
+class FakeNotion:
+    """
+    Servidor local con bases de datos en memoria
+
+    databases: {database_id: [páginas]}
+    rollups: {database_id: {propiedad rollup: (propiedad relation, propiedad de destino)}}
+    rate: peticiones por segundo antes de responder 429 (None = sin límite)
+    """
+
+    def __init__(self, databases, rollups=None, rate=None, burst=3, latency=0.0):
+        self.pages = {}
+        self.databases = {}
+        self.parents = {}
+        # database_id -> {nombre de propiedad: id codificado como en Notion}
+        self.schemas = {}
+        for database_id, pages in databases.items():
+            self.databases[database_id] = []
+            for page in pages:
+                self._store(database_id, page)
+
+        self.rollups = rollups or {}
+        self.rate = rate
+        self.burst = burst
+        self.latency = latency
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.throttled = 0
+        self.bytes_sent = 0
+        self.server = None
+
+    def _store(self, database_id, page):
+        self.pages[page["id"]] = page
+        self.parents[page["id"]] = database_id
+        self.databases[database_id].append(page["id"])
+        self._register_properties(database_id, page)
+
+    def _register_properties(self, database_id, page):
+        """Da id a las propiedades nuevas; como en Notion, el título se llama "title" """
+        schema = self.schemas.setdefault(database_id, {})
+        for name, prop in page["properties"].items():
+            if name not in schema:
+                prop_id = "title" if prop.get("type") == "title" else quote(f":{len(schema):03d}")
+                schema[name] = prop_id
+
+    # --- Servidor ---
+
+    def start(self):
+        """Arranca el servidor en un puerto libre y devuelve la URL base (…/v1)"""
+        fake = self
+
+        class Handler(_Handler):
+            notion = fake
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/v1"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests.clear()
+            self.throttled = 0
+            self.bytes_sent = 0
+
+    def _allow(self):
+        """Token bucket del servidor: False si hay que responder 429"""
+        if self.rate is None:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            self.throttled += 1
+            return False
+
+    # --- Operaciones ---
+
+    def project(self, page, property_ids):
+        """Copia de la página sólo con las propiedades pedidas (ids ya decodificados)"""
+        schema = self.schemas.get(self.parents.get(page["id"]), {})
+        wanted = {name for name, prop_id in schema.items() if unquote(prop_id) in property_ids}
+        projected = dict(page)
+        projected["properties"] = {
+            name: prop for name, prop in page["properties"].items() if name in wanted
+        }
+        return projected
+
+    def render(self, page, property_ids=None):
+        """Página tal como la devuelve Notion: propiedades con su id y listas cortadas"""
+        if property_ids:
+            page = self.project(page, property_ids)
+        schema = self.schemas.get(self.parents.get(page["id"]), {})
+        properties = {}
+        for name, prop in page["properties"].items():
+            prop = dict(prop, id=schema.get(name, name))
+            if prop.get("type") == "relation":
+                relation = prop.get("relation") or []
+                prop["relation"] = relation[:PROPERTY_ITEMS_LIMIT]
+                prop["has_more"] = len(relation) > PROPERTY_ITEMS_LIMIT
+            elif prop.get("type") == "rollup" and (prop.get("rollup") or {}).get("type") == "array":
+                prop["rollup"] = dict(prop["rollup"], array=prop["rollup"]["array"][:PROPERTY_ITEMS_LIMIT])
+            properties[name] = prop
+        return dict(page, properties=properties)
+
+    def get_database(self, database_id):
+        if database_id not in self.databases:
+            return 404, {"object": "error", "status": 404, "code": "object_not_found"}
+        with self.lock:
+            schema = dict(self.schemas.get(database_id, {}))
+        return 200, {
+            "object": "database",
+            "id": database_id,
+            "properties": {name: {"id": prop_id, "name": name} for name, prop_id in schema.items()},
+        }
+
+    def query(self, database_id, body):
+        if database_id not in self.databases:
+            return 404, {"object": "error", "status": 404, "code": "object_not_found"}
+
+        with self.lock:
+            # Las páginas archivadas no salen en las consultas
+            ids = [i for i in self.databases[database_id] if not self.pages[i].get("archived")]
+        condition = body.get("filter")
+        if condition:
+            results = [self.pages[i] for i in ids if matches(self.pages[i], condition)]
+        else:
+            results = ids
+
+        start = int(body.get("start_cursor") or 0)
+        size = min(int(body.get("page_size", 100)), 100)
+        chunk = results[start:start + size]
+        if not condition:
+            chunk = [self.pages[i] for i in chunk]
+        has_more = start + size < len(results)
+        return 200, {
+            "object": "list",
+            "results": chunk,
+            "has_more": has_more,
+            "next_cursor": str(start + size) if has_more else None,
+        }
+
+    def create_page(self, body):
+        database_id = (body.get("parent") or {}).get("database_id")
+        if database_id not in self.databases:
+            return 404, {"object": "error", "status": 404, "code": "object_not_found"}
+
+        page = {
+            "object": "page",
+            "id": str(uuid.uuid4()),
+            "last_edited_time": now_iso(),
+            "properties": body.get("properties", {}),
+        }
+        with self.lock:
+            self._store(database_id, page)
+        return 200, page
+
+    def update_page(self, page_id, body):
+        page = self.pages.get(page_id)
+        if page is None:
+            return 404, {"object": "error", "status": 404, "code": "object_not_found"}
+
+        with self.lock:
+            page["properties"].update(body.get("properties", {}))
+            if "archived" in body:
+                page["archived"] = bool(body["archived"])
+            page["last_edited_time"] = now_iso()
+            self._refresh_rollups(page)
+            self._register_properties(self.parents[page_id], page)
+        return 200, page
+
+    def get_page(self, page_id):
+        page = self.pages.get(page_id)
+        if page is None:
+            return 404, {"object": "error", "status": 404, "code": "object_not_found"}
+        return 200, page
+
+    def get_property(self, page_id, property_id, start_cursor=None, page_size=100):
+        """Valores de una propiedad de la página: relaciones y rollups "show original" paginados"""
+        page = self.pages.get(page_id)
+        schema = self.schemas.get(self.parents.get(page_id), {})
+        name = next((name for name, prop_id in schema.items() if unquote(prop_id) == property_id), None)
+        if page is None or name not in page["properties"]:
+            return 404, {"object": "error", "status": 404, "code": "object_not_found"}
+
+        prop = page["properties"][name]
+        prop_id = schema[name]
+        if prop.get("type") == "relation":
+            items = [
+                {"object": "property_item", "id": prop_id, "type": "relation", "relation": {"id": related["id"]}}
+                for related in prop.get("relation") or []
+            ]
+            summary = {"type": "relation", "relation": {}}
+        elif prop.get("type") == "rollup" and (prop.get("rollup") or {}).get("type") == "array":
+            items = [dict(item, object="property_item", id=prop_id) for item in prop["rollup"]["array"]]
+            summary = {"type": "rollup", "rollup": {"type": "array", "array": [],
+                                                    "function": prop["rollup"].get("function")}}
+        else:
+            return 200, dict(prop, object="property_item", id=prop_id)
+
+        start = int(start_cursor or 0)
+        size = min(int(page_size or 100), 100)
+        has_more = start + size < len(items)
+        return 200, {
+            "object": "list",
+            "results": items[start:start + size],
+            "has_more": has_more,
+            "next_cursor": str(start + size) if has_more else None,
+            "type": "property_item",
+            "property_item": dict(summary, id=prop_id),
+        }
+
+    def _refresh_rollups(self, page):
+        """Recalcula los rollups "show original" de fechas a partir de la relación"""
+        for rollup_prop, (relation_prop, target_prop) in self.rollups.get(self.parents[page["id"]], {}).items():
+            relation = page["properties"].get(relation_prop, {}).get("relation", [])
+            items = []
+            for related in relation:
+                target = self.pages.get(related["id"], {}).get("properties", {}).get(target_prop, {})
+                items.append({"type": "date", "date": target.get("date")})
+            page["properties"][rollup_prop] = {
+                "type": "rollup",
+                "rollup": {"type": "array", "array": items, "function": "show_original"},
+            }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive como Notion; sin Nagle para no añadir ~40 ms por respuesta
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    notion = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, extra_headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in extra_headers:
+            self.send_header(name, value)
+        self.end_headers()
+        # Antes de escribir: el cliente puede leer las estadísticas nada más recibir la respuesta
+        with self.notion.lock:
+            self.notion.bytes_sent += len(data)
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _route(self, method, parts, query):
+        """Operación que corresponde a la petición: (nombre, función) o (None, None)"""
+        notion = self.notion
+        if method == "POST" and len(parts) == 4 and parts[1] == "databases" and parts[3] == "query":
+            return "query", lambda body: notion.query(parts[2], body)
+        if method == "POST" and parts[1:] == ["pages"]:
+            return "create_page", notion.create_page
+        if method == "PATCH" and len(parts) == 3 and parts[1] == "pages":
+            return "update_page", lambda body: notion.update_page(parts[2], body)
+        if method == "GET" and len(parts) == 3 and parts[1] == "pages":
+            return "get_page", lambda body: notion.get_page(parts[2])
+        if method == "GET" and len(parts) == 5 and parts[1] == "pages" and parts[3] == "properties":
+            return "get_property", lambda body: notion.get_property(
+                parts[2], unquote(parts[4]), query.get("start_cursor", [None])[0], query.get("page_size", [100])[0]
+            )
+        if method == "GET" and len(parts) == 3 and parts[1] == "databases":
+            return "get_database", lambda body: notion.get_database(parts[2])
+        return None, None
+
+    def _handle(self, method):
+        body = self._body() if method in ("POST", "PATCH") else {}
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        query = parse_qs(url.query)
+        property_ids = set(query.get("filter_properties", []))
+        name, operation = self._route(method, parts, query)
+        if operation is None:
+            return self._send(400, {"object": "error", "status": 400, "code": "invalid_request_url"})
+
+        with self.notion.lock:
+            self.notion.requests[name] += 1
+
+        if not self.notion._allow():
+            return self._send(
+                429,
+                {"object": "error", "status": 429, "code": "rate_limited"},
+                [("Retry-After", "1")],
+            )
+        if self.notion.latency:
+            time.sleep(self.notion.latency)
+
+        status, result = operation(body)
+        if status == 200 and name == "query":
+            result = dict(result, results=[
+                self.notion.render(page, property_ids) for page in result["results"]
+            ])
+        elif status == 200 and name in ("get_page", "create_page", "update_page"):
+            result = self.notion.render(result, property_ids)
+        self._send(status, result)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
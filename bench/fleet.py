@@ -0,0 +1,271 @@
+"""
+Flotas sintéticas de dispositivos y reservas con la misma forma que devuelve la API de Notion
+
+generate_fleet() crea páginas de Devices y Locations reproducibles (misma
+semilla = mismos datos) con la densidad de reservas que se pida y un
+porcentaje de casos raros que la app tiene que aguantar: reservas sin fin,
+sin fechas, fechas mal escritas, rollups calculados, sin tag, sin nombre o
+con el nombre repetido. Con extra_properties se añaden columnas que la app
+no lee, como en una base de datos Devices real con muchas propiedades.
+
+Las páginas sirven tanto para el servidor local (fake_notion) como para
+medir directamente el motor de disponibilidad (records.device_from_page).
+
+    python -m bench.fleet --size 1000 --seed 7 --output fleet.json
+"""
+import argparse
+import json
+import random
+import uuid
+from collections import Counter, namedtuple
+from datetime import date, timedelta
+
+
+# Fecha de referencia de las reservas generadas
+BASE_DATE = date(2025, 1, 1)
+
+TAGS = ("Ultra", "Neo 4", "Quest 3", "Pico 4")
+
+# Casos raros que se pueden generar (uno por dispositivo afectado)
+PATHOLOGICAL_KINDS = (
+    "open_ended",       # reserva sin fecha de fin
+    "missing_dates",    # location relacionada pero el rollup no tiene fechas
+    "malformed",        # fechas que no son ISO válidas
+    "computed_rollup",  # rollup "earliest/latest" en lugar de "show original"
+    "no_tag",           # Tags vacío
+    "no_name",          # título vacío
+    "duplicate_name",   # mismo nombre que el dispositivo anterior
+)
+
+# - devices / locations: páginas con la forma de la API
+# - pathological: Counter con cuántos dispositivos tienen cada caso raro
+Fleet = namedtuple("Fleet", ["devices", "locations", "pathological"])
+
+
+def page_id(prefix, number):
+    """Id de página estable (mismo número = mismo id en cada ejecución)"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{prefix}/{number}"))
+
+
+def title(text):
+    if not text:
+        return {"type": "title", "title": []}
+    return {"type": "title", "title": [{"type": "text", "text": {"content": text}, "plain_text": text}]}
+
+
+def date_rollup(values):
+    """Rollup "show original" de fechas: una entrada por location relacionada"""
+    return {
+        "type": "rollup",
+        "rollup": {
+            "type": "array",
+            "array": [
+                {"type": "date", "date": {"start": value, "end": None} if value else None}
+                for value in values
+            ],
+            "function": "show_original",
+        },
+    }
+
+
+def computed_date_rollup(value, function):
+    """Rollup calculado (earliest_date, latest_date...): una sola fecha"""
+    return {
+        "type": "rollup",
+        "rollup": {
+            "type": "date",
+            "date": {"start": value, "end": None} if value else None,
+            "function": function,
+        },
+    }
+
+
+def device_page(number, name, tag, bookings, edited="2025-01-01T00:00:00.000Z"):
+    """
+    Página de la base de datos Devices
+
+    bookings: lista de (location_id, inicio, fin) con fechas ISO o None
+    """
+    return {
+        "object": "page",
+        "id": page_id("device", number),
+        "last_edited_time": edited,
+        "properties": {
+            "Name": title(name),
+            "Tags": {"type": "select", "select": {"name": tag} if tag else None},
+            "Location": {
+                "type": "relation",
+                "relation": [{"id": location_id} for location_id, _, _ in bookings],
+            },
+            "Start Date": date_rollup([start for _, start, _ in bookings]),
+            "End Date": date_rollup([end for _, _, end in bookings]),
+        },
+    }
+
+
+def location_page(number, name, kind, start=None, end=None, units=0,
+                  edited="2025-01-01T00:00:00.000Z"):
+    """Página de la base de datos Locations (kind: "Client" o "In House")"""
+    return {
+        "object": "page",
+        "id": page_id("location", number),
+        "last_edited_time": edited,
+        "properties": {
+            "Name": title(name),
+            "Type": {"type": "select", "select": {"name": kind}},
+            "Units": {"type": "rollup", "rollup": {"type": "number", "number": units}},
+            "Start Date": {"type": "date", "date": {"start": start, "end": None} if start else None},
+            "End Date": {"type": "date", "date": {"start": end, "end": None} if end else None},
+        },
+    }
+
+
+def extra_properties(count, rng):
+    """Propiedades de relleno (notas, número de serie, estado...) que la app no usa"""
+    props = {}
+    for number in range(count):
+        kind = number % 3
+        if kind == 0:
+            text = " ".join(rng.choice(("revisado", "cargador", "funda", "ok", "pendiente")) for _ in range(12))
+            props[f"Notas {number}"] = {
+                "type": "rich_text",
+                "rich_text": [{"type": "text", "text": {"content": text}, "plain_text": text,
+                               "annotations": {"bold": False, "italic": False, "color": "default"}}],
+            }
+        elif kind == 1:
+            props[f"Serie {number}"] = {"type": "number", "number": rng.randrange(10 ** 9)}
+        else:
+            props[f"Estado {number}"] = {
+                "type": "select",
+                "select": {"id": str(rng.randrange(10 ** 6)), "name": rng.choice(("Nuevo", "Usado")), "color": "gray"},
+            }
+    return props
+
+
+def _location_dates(location):
+    props = location["properties"]
+    start = props["Start Date"]["date"]
+    end = props["End Date"]["date"]
+    return (start or {}).get("start"), (end or {}).get("start")
+
+
+def _make_pathological(kind, device, previous, rng):
+    """Estropea una página de dispositivo según el caso raro indicado"""
+    props = device["properties"]
+    starts = props["Start Date"]["rollup"]["array"]
+    ends = props["End Date"]["rollup"]["array"]
+
+    if kind == "open_ended" and ends:
+        ends[0]["date"] = None
+    elif kind == "missing_dates" and starts:
+        starts[0]["date"] = None
+        ends[0]["date"] = None
+    elif kind == "malformed" and starts:
+        starts[0]["date"] = {"start": rng.choice(["2025-02-30", "not-a-date", "01/05/2025"]), "end": None}
+    elif kind == "computed_rollup" and starts:
+        first_start = (starts[0]["date"] or {}).get("start")
+        last_end = (ends[-1]["date"] or {}).get("start")
+        props["Start Date"] = computed_date_rollup(first_start, "earliest_date")
+        props["End Date"] = computed_date_rollup(last_end, "latest_date")
+    elif kind == "no_tag":
+        props["Tags"]["select"] = None
+    elif kind == "no_name":
+        props["Name"] = title("")
+    elif kind == "duplicate_name" and previous is not None:
+        props["Name"] = json.loads(json.dumps(previous["properties"]["Name"]))
+    else:
+        return False
+    return True
+
+
+def generate_fleet(size, seed=0, booking_density=0.35, max_bookings=3,
+                   in_house=5, pathological=0.02, span_days=365, max_duration=30,
+                   extra_properties_count=0):
+    """
+    Genera una flota de `size` dispositivos con sus Locations
+
+    - booking_density: proporción de dispositivos con al menos una reserva
+    - max_bookings: reservas como máximo por dispositivo reservado
+    - in_house: ubicaciones In House (sólo fecha de inicio, sin fin)
+    - pathological: proporción de dispositivos con algún caso raro
+    - span_days / max_duration: las reservas empiezan en los span_days días
+      siguientes a BASE_DATE y duran hasta max_duration días
+    - extra_properties_count: propiedades de relleno por dispositivo
+    """
+    rng = random.Random(seed)
+
+    # Ubicaciones In House: empiezan un día y no tienen fin
+    locations = []
+    for number in range(in_house):
+        start = BASE_DATE + timedelta(days=rng.randrange(span_days))
+        locations.append(location_page(number, f"In House {number:03d}", "In House", start.isoformat()))
+
+    # Proyectos de cliente: varios dispositivos comparten la misma location
+    for number in range(in_house, in_house + max(1, size // 10)):
+        start = BASE_DATE + timedelta(days=rng.randrange(span_days))
+        end = start + timedelta(days=rng.randint(1, max_duration))
+        locations.append(location_page(
+            number, f"Cliente {number:05d}", "Client", start.isoformat(), end.isoformat()
+        ))
+
+    units = Counter()
+    devices = []
+    kinds = Counter()
+    for number in range(size):
+        bookings = []
+        if rng.random() < booking_density:
+            for location in rng.sample(locations, rng.randint(1, min(max_bookings, len(locations)))):
+                start, end = _location_dates(location)
+                bookings.append((location["id"], start, end))
+                units[location["id"]] += 1
+
+        tag = rng.choice(TAGS)
+        device = device_page(number, f"{tag} {number:05d}", tag, bookings)
+
+        if rng.random() < pathological:
+            kind = rng.choice(PATHOLOGICAL_KINDS)
+            if _make_pathological(kind, device, devices[-1] if devices else None, rng):
+                kinds[kind] += 1
+
+        if extra_properties_count:
+            device["properties"].update(extra_properties(extra_properties_count, rng))
+
+        devices.append(device)
+
+    for location in locations:
+        location["properties"]["Units"]["rollup"]["number"] = units[location["id"]]
+
+    return Fleet(devices, locations, kinds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera una flota sintética en JSON")
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--density", type=float, default=0.35)
+    parser.add_argument("--max-bookings", type=int, default=3)
+    parser.add_argument("--in-house", type=int, default=5)
+    parser.add_argument("--pathological", type=float, default=0.02)
+    parser.add_argument("--extra-properties", type=int, default=0)
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args(argv)
+
+    fleet = generate_fleet(
+        args.size,
+        seed=args.seed,
+        booking_density=args.density,
+        max_bookings=args.max_bookings,
+        in_house=args.in_house,
+        pathological=args.pathological,
+        extra_properties_count=args.extra_properties,
+    )
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump({"devices": fleet.devices, "locations": fleet.locations}, file, ensure_ascii=False)
+
+    print(f"{len(fleet.devices)} dispositivos, {len(fleet.locations)} ubicaciones")
+    for kind, count in sorted(fleet.pathological.items()):
+        print(f"  {kind}: {count}")
+
+
+if __name__ == "__main__":
+    main()
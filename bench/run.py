@@ -0,0 +1,294 @@
+"""
+Benchmark de extremo a extremo de los caminos críticos de la app
+
+Para cada tamaño de flota genera datos sintéticos (fleet, con --seed),
+arranca un servidor local (fake_notion) y mide:
+- fetch: descarga de todas las páginas de Devices (paginación incluida)
+- fetch_filtered: descarga sólo de los candidatos del rango (notion_filters)
+- fetch_projected: descarga de Devices pidiendo sólo las propiedades que
+  lee la app (filter_properties); usar con --extra-properties
+- extract: páginas -> Device (records.device_from_page, lo que usa la app)
+- index_build / query: índice de disponibilidad y consulta de un rango
+- vector_build / vector_query: lo mismo con el motor NumPy
+- assign: asignación en bloque (lectura de la relación y PATCH en paralelo)
+  de --assign dispositivos, empezando por los que más reservas tienen; se
+  comprueba que conservan todas (con --max-bookings 30 pasan de las 25 que
+  Notion incluye en cada página)
+
+    python -m bench.run --sizes 100 1000 10000 --output bench/report.json
+    python -m bench.run --compare bench/report.json
+    python -m bench.run --engine-only --sizes 100000
+
+Con --engine-only no se arranca el servidor: sólo se miden extract y los
+motores de disponibilidad sobre las páginas generadas.
+
+Con --compare se comparan las medianas con un informe anterior y el
+comando termina con error si alguna fase empeora más de --threshold.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+import notion_api
+from assignment import assign_devices
+from availability import AvailabilityIndex, VectorAvailability
+from notion_filters import availability_filter
+from notion_schema import DEVICE_FIELDS, property_names
+from records import device_from_page
+
+from bench.fake_notion import FakeNotion
+from bench.fleet import BASE_DATE, generate_fleet
+
+
+DEVICES_DB = "bench-devices"
+LOCATIONS_DB = "bench-locations"
+
+DEFAULT_SIZES = (100, 1000, 10000)
+PHASES = ("fetch", "fetch_filtered", "fetch_projected", "extract", "index_build", "query", "vector_build", "vector_query", "assign")
+ENGINE_PHASES = ("extract", "index_build", "query", "vector_build", "vector_query")
+
+
+def timed(function, *args, **kwargs):
+    """Ejecuta la función y devuelve (resultado, segundos)"""
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+# Rango consultado en todas las fases de disponibilidad
+WINDOW = (BASE_DATE + timedelta(days=30), BASE_DATE + timedelta(days=37))
+
+
+def bench_engine(pages, samples, stats):
+    """Fases que no tocan la red: extracción y motores de disponibilidad"""
+    devices, elapsed = timed(lambda: [device_from_page(page) for page in pages])
+    samples["extract"].append(elapsed)
+
+    index, elapsed = timed(AvailabilityIndex, devices)
+    samples["index_build"].append(elapsed)
+
+    available, elapsed = timed(index.available, *WINDOW)
+    samples["query"].append(elapsed)
+    stats["available"] = len(available)
+
+    vector, elapsed = timed(VectorAvailability, devices)
+    samples["vector_build"].append(elapsed)
+
+    _, elapsed = timed(vector.available, *WINDOW)
+    samples["vector_query"].append(elapsed)
+
+    return devices
+
+
+def relation(fake, device_id):
+    """Relación completa de un dispositivo en el servidor local"""
+    return [related["id"] for related in fake.pages[device_id]["properties"]["Location"]["relation"]]
+
+
+def bench_size(size, repeat, assign_count, server_rate, fleet_options, engine_only=False):
+    """Mide todas las fases para una flota de `size` dispositivos"""
+    fleet = generate_fleet(size, **fleet_options)
+    samples = {phase: [] for phase in (ENGINE_PHASES if engine_only else PHASES)}
+    stats = {"locations": len(fleet.locations), "pathological": dict(fleet.pathological)}
+
+    if engine_only:
+        for _ in range(repeat):
+            bench_engine(fleet.devices, samples, stats)
+        return samples, stats
+
+    fake = FakeNotion(
+        {DEVICES_DB: fleet.devices, LOCATIONS_DB: fleet.locations},
+        rollups={DEVICES_DB: {"Start Date": ("Location", "Start Date"),
+                              "End Date": ("Location", "End Date")}},
+        rate=server_rate,
+    )
+    target_location = fleet.locations[0]["id"]
+
+    with fake:
+        notion_api.NOTION_API_URL = fake.url
+        notion_api.clear_property_ids()
+
+        for _ in range(repeat):
+            fake.reset_stats()
+            pages, elapsed = timed(notion_api.get_all_pages, DEVICES_DB)
+            samples["fetch"].append(elapsed)
+            stats["fetch_requests"] = fake.requests["query"]
+            stats["fetch_bytes"] = fake.bytes_sent
+
+            devices = bench_engine(pages, samples, stats)
+
+            fake.reset_stats()
+            candidates, elapsed = timed(
+                notion_api.get_all_pages, DEVICES_DB, filter=availability_filter(*WINDOW)
+            )
+            samples["fetch_filtered"].append(elapsed)
+            stats["filtered_candidates"] = len(candidates)
+            stats["filtered_bytes"] = fake.bytes_sent
+
+            # El esquema se lee una vez por proceso: fuera de la medida
+            notion_api.get_property_ids(DEVICES_DB)
+            fake.reset_stats()
+            _, elapsed = timed(notion_api.get_all_pages, DEVICES_DB, properties=property_names(DEVICE_FIELDS))
+            samples["fetch_projected"].append(elapsed)
+            stats["projected_bytes"] = fake.bytes_sent
+
+        booked = sorted(devices, key=lambda device: device.locations_count, reverse=True)
+        device_ids = [device.id for device in booked[:assign_count]]
+        expected = {device_id: relation(fake, device_id) for device_id in device_ids}
+        for device_id in device_ids:
+            if target_location not in expected[device_id]:
+                expected[device_id].append(target_location)
+
+        for _ in range(repeat):
+            fake.reset_stats()
+            report, elapsed = timed(assign_devices, device_ids, target_location)
+            samples["assign"].append(elapsed)
+            stats["assign_failed"] = len(report.failed)
+            stats["throttled"] = fake.throttled
+            # Dispositivos que han perdido alguna reserva al asignarlos
+            stats["assign_lost"] = sum(
+                relation(fake, device_id) != expected[device_id] for device_id in report.succeeded
+            )
+
+    return samples, stats
+
+
+def summarize(samples):
+    """Milisegundos: mediana, mínimo y máximo de cada fase"""
+    return {
+        phase: {
+            "median_ms": round(statistics.median(values) * 1000, 3),
+            "min_ms": round(min(values) * 1000, 3),
+            "max_ms": round(max(values) * 1000, 3),
+        }
+        for phase, values in samples.items() if values
+    }
+
+
+def print_report(results):
+    phases = [phase for phase in PHASES if any(phase in result["phases"] for result in results.values())]
+    header = f"{'size':>7}  " + "  ".join(f"{phase:>12}" for phase in phases)
+    print(header)
+    print("-" * len(header))
+    for size, result in results.items():
+        row = "  ".join(
+            f"{result['phases'][phase]['median_ms']:>10.1f}ms" if phase in result["phases"] else f"{'-':>12}"
+            for phase in phases
+        )
+        print(f"{size:>7}  {row}")
+
+
+def compare(results, baseline, threshold, min_ms):
+    """
+    Imprime la variación respecto al informe anterior; devuelve las regresiones
+
+    Una fase empeora si su mediana sube más de `threshold` (proporción) y
+    además más de `min_ms` milisegundos (las fases muy cortas tienen mucho ruido).
+    """
+    regressions = []
+    print(f"\nComparación con el informe anterior (umbral {threshold:.0%}):")
+    for size, result in results.items():
+        previous = baseline.get("results", {}).get(str(size))
+        if not previous:
+            print(f"  {size}: sin datos en el informe anterior")
+            continue
+        for phase in PHASES:
+            old = previous["phases"].get(phase, {}).get("median_ms")
+            if not old or phase not in result["phases"]:
+                continue
+            new = result["phases"][phase]["median_ms"]
+            change = new / old - 1
+            flag = ""
+            if change > threshold and new - old > min_ms:
+                flag = "  <-- REGRESIÓN"
+                regressions.append((size, phase, change))
+            print(f"  {size:>7} {phase:>12}: {old:>10.1f}ms -> {new:>10.1f}ms ({change:+.0%}){flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--assign", type=int, default=50, help="dispositivos por asignación en bloque")
+    parser.add_argument("--engine-only", action="store_true", help="sin servidor: sólo extract y motores")
+    parser.add_argument("--seed", type=int, default=0, help="semilla de la flota generada")
+    parser.add_argument("--density", type=float, default=0.35, help="proporción de dispositivos reservados")
+    parser.add_argument("--pathological", type=float, default=0.02, help="proporción de casos raros")
+    parser.add_argument("--max-bookings", type=int, default=3, help="reservas como máximo por dispositivo")
+    parser.add_argument("--extra-properties", type=int, default=0,
+                        help="propiedades por dispositivo que la app no lee")
+    parser.add_argument("--client-rate", type=float, default=0,
+                        help="límite de peticiones por segundo del cliente (0 = sin límite)")
+    parser.add_argument("--server-rate", type=float, default=None,
+                        help="peticiones por segundo antes de que el servidor responda 429")
+    parser.add_argument("--output", help="guardar el informe en JSON")
+    parser.add_argument("--compare", help="informe JSON anterior con el que comparar")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="empeoramiento relativo que se considera regresión")
+    parser.add_argument("--min-ms", type=float, default=1.0,
+                        help="empeoramiento mínimo en milisegundos para considerarlo regresión")
+    args = parser.parse_args(argv)
+
+    # El límite de Notion (3/s) dominaría todas las medidas: por defecto se quita
+    if args.client_rate > 0:
+        notion_api.rate_limiter.rate = args.client_rate
+    else:
+        notion_api.rate_limiter.rate = 1e9
+        notion_api.rate_limiter.capacity = 1e9
+        notion_api.rate_limiter.tokens = 1e9
+
+    fleet_options = {
+        "seed": args.seed,
+        "booking_density": args.density,
+        "max_bookings": args.max_bookings,
+        "pathological": args.pathological,
+        "extra_properties_count": args.extra_properties,
+    }
+
+    results = {}
+    for size in args.sizes:
+        print(f"Flota de {size} dispositivos...", file=sys.stderr)
+        samples, stats = bench_size(
+            size, args.repeat, args.assign, args.server_rate, fleet_options, args.engine_only
+        )
+        results[size] = {"phases": summarize(samples), "stats": stats}
+
+    print_report(results)
+
+    lost = {size: result["stats"].get("assign_lost") for size, result in results.items()}
+    if any(lost.values()):
+        print(f"Asignaciones que han borrado reservas: {lost}", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "date": date.today().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "assign": args.assign,
+            "client_rate": args.client_rate,
+            "server_rate": args.server_rate,
+            "engine_only": args.engine_only,
+            "fleet": fleet_options,
+        },
+        "results": {str(size): result for size, result in results.items()},
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.threshold, args.min_ms):
+            return 1
+    return 1 if any(lost.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
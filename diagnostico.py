@@ -1,18 +1,14 @@
-import requests
 import json
-import os
+
+from notion_api import notion_request
+from notion_schema import compile_extractor, device_fields
 
 
 # Configuración de Notion
-NOTION_TOKEN = os.getenv("NOTION_TOKEN")
-NOTION_VERSION = "2022-06-28"
 DEVICES_ID = "28d58a35e41180dd8080d1953c15ac23"
 
-headers = {
-    "Authorization": f"Bearer {NOTION_TOKEN}",
-    "Content-Type": "application/json",
-    "Notion-Version": NOTION_VERSION,
-}
+# Mismo mapeo de campos que usan las apps
+extract_device_fields = compile_extractor(device_fields("📍 Locations_demo"))
 
 print("=" * 80)
 print("DIAGNÓSTICO DE TAGS EN NOTION")
@@ -20,10 +16,9 @@ print("=" * 80)
 print()
 
 # Obtener páginas
-url = f"https://api.notion.com/v1/databases/{DEVICES_ID}/query"
 payload = {"page_size": 5}  # Solo los primeros 5 para ver
 
-response = requests.post(url, json=payload, headers=headers)
+response = notion_request("POST", f"databases/{DEVICES_ID}/query", payload)
 data = response.json()
 
 if response.status_code != 200:
@@ -40,16 +35,14 @@ else:
         print(f"DISPOSITIVO {i}")
         print(f"{'=' * 80}")
         
-        # Nombre
-        try:
-            if props.get("Name") and props["Name"]["title"]:
-                name = props["Name"]["title"][0]["text"]["content"]
-            else:
-                name = "Sin nombre"
-        except:
-            name = "Error al leer nombre"
+        # Campos tal y como los leen las apps
+        fields = extract_device_fields(props)
+        name = fields["name"] or "Sin nombre"
         
         print(f"📱 Nombre: {name}")
+        print("🧩 CAMPOS EXTRAÍDOS POR LAS APPS:")
+        for field, value in fields.items():
+            print(f"   - {field}: {value}")
         print()
         
         # Ver TODOS los campos disponibles
@@ -98,6 +91,16 @@ else:
         
         print()
 
+    # Campos que no se pudieron leer (la propiedad existe pero con otra forma)
+    print("📉 CAMPOS QUE NO SE PUDIERON LEER:")
+    if extract_device_fields.failures:
+        for field, count in extract_device_fields.failures.items():
+            prop_name, kind = extract_device_fields.fields[field]
+            print(f"   - {field} ('{prop_name}', tipo esperado {kind}): {count} páginas")
+    else:
+        print("   ✅ Ninguno")
+    print()
+
 print()
 print("=" * 80)
 print("DIAGNÓSTICO COMPLETADO")
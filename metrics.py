@@ -0,0 +1,223 @@
+"""
+Métricas de las peticiones a Notion: número, errores, 429, latencias y bytes
+
+notion_request() registra cada intento HTTP por endpoint y por la función
+que lo originó (la primera fuera de notion_api). Los datos se pueden ver en
+el panel de administración o exportar en formato de texto de Prometheus.
+"""
+import math
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Límites (segundos) de los cubos del histograma de latencias
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Latencias recientes que se guardan por endpoint para los percentiles
+SAMPLE_SIZE = int(os.getenv("NOTION_METRICS_SAMPLES", "2000"))
+
+# Módulos y funciones que sólo pasan las peticiones (no cuentan como
+# "función que origina la petición": se sigue subiendo por la pila)
+INTERNAL_MODULES = {"notion_api", "notion_mirror", "metrics"}
+PASSTHROUGH_FUNCTIONS = {"iter_pages", "get_pages"}
+
+_ID_PATTERN = re.compile(r"[0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{12}", re.I)
+
+
+def endpoint_name(method, path):
+    """Endpoint sin ids: "POST databases/{id}/query", "PATCH pages/{id}"..."""
+    path = _ID_PATTERN.sub("{id}", path.strip("/").split("?")[0])
+    return f"{method.upper()} {path}"
+
+
+def calling_function():
+    """Módulo.función que ha llamado a la API (salta los módulos internos)"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module not in INTERNAL_MODULES and frame.f_code.co_name not in PASSTHROUGH_FUNCTIONS:
+            name = module.rsplit(".", 1)[-1]
+            if name == "__main__":
+                name = os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
+            return f"{name}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+def percentile(values, fraction):
+    """Percentil por el método del rango más cercano (values ya ordenados)"""
+    if not values:
+        return None
+    # Se redondea antes de ceil para que 0.07 * 100 (7.000000000000001) quede en 7
+    position = max(0, min(len(values) - 1, math.ceil(round(fraction * len(values), 9)) - 1))
+    return values[position]
+
+
+class RequestMetrics:
+    """Contadores e histogramas de las peticiones, compartidos por todo el proceso"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            # (endpoint, función) -> contadores
+            self.calls = Counter()
+            self.errors = Counter()
+            self.throttled = Counter()
+            self.bytes = Counter()
+            # endpoint -> histograma (acumulado) y muestras de latencia
+            self.buckets = {}
+            self.counts = Counter()
+            self.durations = Counter()
+            self.samples = {}
+            # (endpoint, código de estado) -> peticiones
+            self.statuses = Counter()
+
+    def record(self, endpoint, caller, status, duration, size=0):
+        """
+        Registra un intento HTTP
+
+        status: código HTTP, o None si falló la conexión (cuenta como error)
+        size: bytes del cuerpo de la respuesta
+        """
+        key = (endpoint, caller)
+        with self.lock:
+            self.calls[key] += 1
+            if status is None or status >= 400:
+                self.errors[key] += 1
+            if status == 429:
+                self.throttled[key] += 1
+            self.bytes[key] += size
+            self.statuses[(endpoint, status or "error")] += 1
+
+            buckets = self.buckets.setdefault(endpoint, [0] * len(BUCKETS))
+            for i, limit in enumerate(BUCKETS):
+                if duration <= limit:
+                    buckets[i] += 1
+            self.counts[endpoint] += 1
+            self.durations[endpoint] += duration
+            self.samples.setdefault(endpoint, deque(maxlen=SAMPLE_SIZE)).append(duration)
+
+    def summary(self):
+        """Filas por endpoint y función: llamadas, errores, 429, KB recibidos y p50/p95/p99 (ms) del endpoint"""
+        with self.lock:
+            latencies = {endpoint: sorted(samples) for endpoint, samples in self.samples.items()}
+            rows = []
+            for (endpoint, caller), calls in sorted(self.calls.items()):
+                values = latencies.get(endpoint, [])
+                rows.append({
+                    "endpoint": endpoint,
+                    "caller": caller,
+                    "calls": calls,
+                    "errors": self.errors[(endpoint, caller)],
+                    "throttled": self.throttled[(endpoint, caller)],
+                    "kb": round(self.bytes[(endpoint, caller)] / 1024, 1),
+                    "kb_per_call": round(self.bytes[(endpoint, caller)] / 1024 / calls, 1),
+                    "p50_ms": _ms(percentile(values, 0.50)),
+                    "p95_ms": _ms(percentile(values, 0.95)),
+                    "p99_ms": _ms(percentile(values, 0.99)),
+                })
+            return rows
+
+    def prometheus_text(self):
+        """Métricas en formato de texto de Prometheus"""
+        lines = [
+            "# HELP notion_requests_total Peticiones HTTP a la API de Notion",
+            "# TYPE notion_requests_total counter",
+        ]
+        with self.lock:
+            for (endpoint, caller), count in sorted(self.calls.items()):
+                lines.append(f"notion_requests_total{_labels(endpoint=endpoint, caller=caller)} {count}")
+
+            lines += [
+                "# HELP notion_request_errors_total Peticiones con error (>= 400 o fallo de red)",
+                "# TYPE notion_request_errors_total counter",
+            ]
+            for (endpoint, caller), count in sorted(self.errors.items()):
+                lines.append(f"notion_request_errors_total{_labels(endpoint=endpoint, caller=caller)} {count}")
+
+            lines += [
+                "# HELP notion_rate_limited_total Respuestas 429 de Notion",
+                "# TYPE notion_rate_limited_total counter",
+            ]
+            for (endpoint, caller), count in sorted(self.throttled.items()):
+                lines.append(f"notion_rate_limited_total{_labels(endpoint=endpoint, caller=caller)} {count}")
+
+            lines += [
+                "# HELP notion_response_bytes_total Bytes recibidos en las respuestas de Notion",
+                "# TYPE notion_response_bytes_total counter",
+            ]
+            for (endpoint, caller), count in sorted(self.bytes.items()):
+                lines.append(f"notion_response_bytes_total{_labels(endpoint=endpoint, caller=caller)} {count}")
+
+            lines += [
+                "# HELP notion_responses_total Respuestas por código de estado",
+                "# TYPE notion_responses_total counter",
+            ]
+            for (endpoint, status), count in sorted(self.statuses.items(), key=str):
+                lines.append(f"notion_responses_total{_labels(endpoint=endpoint, status=status)} {count}")
+
+            lines += [
+                "# HELP notion_request_duration_seconds Latencia de cada petición",
+                "# TYPE notion_request_duration_seconds histogram",
+            ]
+            for endpoint, buckets in sorted(self.buckets.items()):
+                count = self.counts[endpoint]
+                for limit, value in zip(BUCKETS, buckets):
+                    lines.append(
+                        f"notion_request_duration_seconds_bucket{_labels(endpoint=endpoint, le=limit)} {value}"
+                    )
+                lines.append(f"notion_request_duration_seconds_bucket{_labels(endpoint=endpoint, le='+Inf')} {count}")
+                lines.append(f"notion_request_duration_seconds_sum{_labels(endpoint=endpoint)} {self.durations[endpoint]:.6f}")
+                lines.append(f"notion_request_duration_seconds_count{_labels(endpoint=endpoint)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def _labels(**labels):
+    parts = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+# Métricas compartidas por todo el proceso
+request_metrics = RequestMetrics()
+
+
+def serve_metrics(port, host="0.0.0.0"):
+    """Sirve /metrics (formato Prometheus) en un hilo aparte; devuelve el servidor"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = request_metrics.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
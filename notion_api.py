@@ -0,0 +1,424 @@
+"""Cliente compartido para la API de Notion"""
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import unquote
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from metrics import calling_function, endpoint_name, request_metrics
+
+
+# Cargar variables de entorno desde el archivo .env
+load_dotenv()
+
+# Configuración de Notion
+NOTION_TOKEN = os.getenv("NOTION_TOKEN")
+NOTION_VERSION = "2022-06-28"
+NOTION_API_URL = os.getenv("NOTION_API_URL", "https://api.notion.com/v1")
+MAX_PAGE_SIZE = 100
+
+# Timeouts en segundos: (conexión, lectura)
+CONNECT_TIMEOUT = float(os.getenv("NOTION_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("NOTION_READ_TIMEOUT", "30"))
+
+# Tamaño del pool de conexiones keep-alive
+POOL_SIZE = int(os.getenv("NOTION_POOL_SIZE", "10"))
+
+# Límite de Notion: ~3 peticiones por segundo por integración
+RATE_LIMIT = float(os.getenv("NOTION_RATE_LIMIT", "3"))
+RATE_BURST = int(os.getenv("NOTION_RATE_BURST", "3"))
+
+# Reintentos ante 429, errores 5xx y fallos de red
+MAX_RETRIES = int(os.getenv("NOTION_MAX_RETRIES", "4"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "PATCH", "DELETE"}
+
+headers = {
+    "Authorization": f"Bearer {NOTION_TOKEN}",
+    "Content-Type": "application/json",
+    "Notion-Version": NOTION_VERSION,
+}
+
+_session = None
+
+# Propiedades que se piden a Notion de cada base de datos: {database_id: [nombres]}
+# (ver set_projection). Sin entrada se descargan todas.
+PROJECTIONS = {}
+
+# Ids de las propiedades de cada base de datos: {database_id: {nombre: id}}
+_property_ids = {}
+# Esquemas que no se pudieron leer: {database_id: instante (monotonic) a partir
+# del cual se vuelve a intentar}. Mientras tanto no se proyecta.
+_property_ids_failed = {}
+SCHEMA_RETRY_SECONDS = float(os.getenv("NOTION_SCHEMA_RETRY", "60"))
+_property_ids_lock = threading.Lock()
+
+
+# Un bloque de resultados de una consulta paginada.
+# - results: páginas devueltas en este bloque
+# - index: número de bloque (0, 1, 2...)
+# - elapsed: segundos que tardó Notion en devolver este bloque
+# - has_more: si quedan más bloques por descargar
+# - bytes: tamaño de la respuesta de Notion (0 si no viene de la red)
+QueryPage = namedtuple("QueryPage", ["results", "index", "elapsed", "has_more", "bytes"], defaults=(0,))
+
+
+class NotionAPIError(Exception):
+    """Error devuelto por la API de Notion"""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"{status_code} - {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+class RateLimiter:
+    """
+    Token bucket compartido por todos los hilos (y sesiones de Streamlit) del proceso
+
+    Cada petición consume un token; los tokens se recargan a `rate` por segundo
+    hasta un máximo de `capacity`. Si Notion responde 429, pause() frena a
+    todos los hilos hasta que pase el Retry-After.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Espera hasta que haya un token libre y lo consume"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Bloquea las peticiones de todo el proceso durante `seconds` segundos"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+rate_limiter = RateLimiter(RATE_LIMIT, RATE_BURST)
+
+
+def set_token(token):
+    """Cambia el token de la integración (para apps que no lo leen del .env)"""
+    headers["Authorization"] = f"Bearer {token}"
+    if _session is not None:
+        _session.headers.update(headers)
+
+
+def get_session():
+    """
+    Devuelve la sesión HTTP compartida por todo el proceso
+
+    La sesión mantiene las conexiones abiertas (keep-alive), así que sólo se
+    paga el handshake TLS una vez en lugar de en cada petición.
+    """
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(headers)
+        _session = session
+    return _session
+
+
+def _is_idempotent(method, path):
+    """Indica si una petición se puede repetir sin efectos secundarios"""
+    if method.upper() in IDEMPOTENT_METHODS:
+        return True
+    # Las consultas a bases de datos usan POST pero sólo leen
+    return method.upper() == "POST" and path.rstrip("/").endswith("/query")
+
+
+def _retry_delay(attempt, response=None):
+    """Segundos a esperar antes del reintento: Retry-After o backoff exponencial"""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), BACKOFF_MAX)
+            except ValueError:
+                pass
+
+    delay = min(BACKOFF_BASE * (2 ** attempt), BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def notion_request(method, path, payload=None, params=None, idempotent=None):
+    """
+    Hace una petición a la API de Notion usando la sesión compartida
+
+    Respeta el límite de peticiones del proceso y reintenta con backoff:
+    - 429: siempre (Notion no ha aplicado la petición)
+    - 5xx y errores de red: sólo si la petición es idempotente
+    """
+    url = f"{NOTION_API_URL}/{path.lstrip('/')}"
+    if idempotent is None:
+        idempotent = _is_idempotent(method, path)
+
+    # Para las métricas: endpoint sin ids y función de la app que hace la petición
+    endpoint = endpoint_name(method, path)
+    caller = calling_function()
+
+    attempt = 0
+    while True:
+        rate_limiter.acquire()
+
+        started = time.perf_counter()
+        try:
+            response = get_session().request(
+                method,
+                url,
+                json=payload,
+                params=params,
+                timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+            )
+        except (requests.ConnectionError, requests.Timeout):
+            request_metrics.record(endpoint, caller, None, time.perf_counter() - started)
+            if not idempotent or attempt >= MAX_RETRIES:
+                raise
+            time.sleep(_retry_delay(attempt))
+            attempt += 1
+            continue
+
+        request_metrics.record(
+            endpoint, caller, response.status_code, time.perf_counter() - started, len(response.content)
+        )
+
+        if response.status_code not in RETRY_STATUS or attempt >= MAX_RETRIES:
+            return response
+
+        if response.status_code == 429:
+            rate_limiter.pause(_retry_delay(attempt, response))
+        elif idempotent:
+            time.sleep(_retry_delay(attempt, response))
+        else:
+            return response
+
+        attempt += 1
+
+
+def set_projection(database_id, property_names):
+    """
+    Pide a Notion sólo estas propiedades (por nombre) en las consultas a la base de datos
+
+    Afecta a todas las consultas de query_database sin `properties` explícito,
+    también a las de la copia local.
+    """
+    PROJECTIONS[database_id] = list(property_names)
+
+
+def get_property_ids(database_id):
+    """
+    Nombre -> id de las propiedades de una base de datos (se lee una vez por proceso)
+
+    Devuelve None si no se puede leer el esquema; en ese caso las consultas
+    traen las páginas completas, como antes. Un fallo no se guarda para
+    siempre: pasados SCHEMA_RETRY_SECONDS se vuelve a intentar.
+    """
+    with _property_ids_lock:
+        if database_id in _property_ids:
+            return _property_ids[database_id]
+        if time.monotonic() < _property_ids_failed.get(database_id, 0):
+            return None
+
+    try:
+        response = notion_request("GET", f"databases/{database_id}")
+    except requests.RequestException:
+        response = None
+
+    property_ids = None
+    if response is not None and response.status_code == 200:
+        # Los ids vienen codificados para URL ("%3AUPp"); requests los vuelve a codificar
+        property_ids = {
+            name: unquote(prop["id"])
+            for name, prop in response.json().get("properties", {}).items()
+            if isinstance(prop, dict) and "id" in prop
+        }
+
+    with _property_ids_lock:
+        if property_ids is None:
+            _property_ids_failed[database_id] = time.monotonic() + SCHEMA_RETRY_SECONDS
+        else:
+            _property_ids[database_id] = property_ids
+            _property_ids_failed.pop(database_id, None)
+    return property_ids
+
+
+def clear_property_ids():
+    """Olvida los esquemas leídos (p. ej. si se han cambiado propiedades en Notion)"""
+    with _property_ids_lock:
+        _property_ids.clear()
+        _property_ids_failed.clear()
+
+
+def resolve_properties(database_id, property_names):
+    """Ids para filter_properties de las propiedades pedidas, o None si no se puede proyectar"""
+    property_ids = get_property_ids(database_id)
+    if not property_ids:
+        return None
+    # Una propiedad que no existe tampoco vendría en la página completa
+    resolved = [property_ids[name] for name in property_names if name in property_ids]
+    return resolved or None
+
+
+def _projection_params(database_id, properties):
+    """Parámetros filter_properties para pedir sólo esas propiedades (None = todas)"""
+    if properties is None:
+        properties = PROJECTIONS.get(database_id)
+    if not properties:
+        return None
+    property_ids = resolve_properties(database_id, properties)
+    if not property_ids:
+        return None
+    return {"filter_properties": property_ids}
+
+
+def get_page(page_id, database_id=None, properties=None):
+    """
+    Lee una página por su id, sin consultar la base de datos
+
+    Con database_id se piden sólo las propiedades de set_projection (o las
+    de `properties`). Lanza NotionAPIError si Notion no la devuelve.
+    """
+    params = _projection_params(database_id, properties) if database_id else None
+    response = notion_request("GET", f"pages/{page_id}", params=params)
+    if response.status_code != 200:
+        raise NotionAPIError(response.status_code, response.text)
+    return response.json()
+
+
+def get_property_items(page_id, property_id):
+    """
+    Todos los valores de una propiedad de una página, siguiendo la paginación
+
+    En las páginas (GET y consultas) Notion devuelve como mucho 25 elementos
+    de cada relación o rollup y marca la relación con has_more; este
+    endpoint los devuelve todos. Lanza NotionAPIError si Notion no responde 200.
+    """
+    path = f"pages/{page_id}/properties/{property_id}"
+    params = {"page_size": MAX_PAGE_SIZE}
+
+    items = []
+    while True:
+        response = notion_request("GET", path, params=params)
+        if response.status_code != 200:
+            raise NotionAPIError(response.status_code, response.text)
+
+        data = response.json()
+        if data.get("object") != "list":
+            # Propiedad de un solo valor: no hay paginación
+            return [data]
+        items.extend(data.get("results", []))
+
+        if not (data.get("has_more") and data.get("next_cursor")):
+            return items
+        params = {"page_size": MAX_PAGE_SIZE, "start_cursor": data["next_cursor"]}
+
+
+def complete_page(page):
+    """
+    La página con sus relaciones y rollups completos aunque pasen de 25 elementos
+
+    Sólo hace peticiones si alguna relación viene cortada (has_more). Entonces
+    también se releen los rollups "show original", que van en el orden de la
+    relación y vienen cortados igual.
+    """
+    properties = page.get("properties", {})
+    truncated = any(
+        isinstance(prop, dict) and prop.get("type") == "relation" and prop.get("has_more")
+        for prop in properties.values()
+    )
+    if not truncated:
+        return page
+
+    completed = dict(properties)
+    for name, prop in properties.items():
+        if not isinstance(prop, dict) or "id" not in prop:
+            continue
+        if prop.get("type") == "relation" and prop.get("has_more"):
+            items = get_property_items(page["id"], prop["id"])
+            completed[name] = dict(prop, relation=[item["relation"] for item in items], has_more=False)
+        elif prop.get("type") == "rollup" and (prop.get("rollup") or {}).get("type") == "array":
+            items = get_property_items(page["id"], prop["id"])
+            array = [{"type": item["type"], item["type"]: item.get(item["type"])} for item in items]
+            completed[name] = dict(prop, rollup=dict(prop["rollup"], array=array))
+
+    return dict(page, properties=completed)
+
+
+def query_database(database_id, filter=None, sorts=None, page_size=MAX_PAGE_SIZE, properties=None):
+    """
+    Consulta una base de datos de Notion siguiendo los cursores de paginación
+
+    Es un generador: devuelve cada bloque (QueryPage) en cuanto llega, así se
+    puede empezar a procesar antes de que se descargue el último.
+
+    properties: nombres de las propiedades que hay que traer (por defecto, las
+    de set_projection). Se piden por id con filter_properties, así las
+    páginas llegan sin el resto de columnas de la base de datos.
+    """
+    path = f"databases/{database_id}/query"
+
+    payload = {"page_size": min(page_size, MAX_PAGE_SIZE)}
+    if filter:
+        payload["filter"] = filter
+    if sorts:
+        payload["sorts"] = sorts
+
+    params = _projection_params(database_id, properties)
+
+    index = 0
+    while True:
+        started = time.perf_counter()
+        response = notion_request("POST", path, payload, params=params)
+        elapsed = time.perf_counter() - started
+
+        if response.status_code != 200:
+            raise NotionAPIError(response.status_code, response.text)
+
+        data = response.json()
+        has_more = bool(data.get("has_more")) and bool(data.get("next_cursor"))
+
+        yield QueryPage(data.get("results", []), index, elapsed, has_more, len(response.content))
+
+        if not has_more:
+            break
+
+        payload["start_cursor"] = data["next_cursor"]
+        index += 1
+
+
+def get_all_pages(database_id, filter=None, sorts=None, properties=None):
+    """Descarga todas las páginas de una base de datos (todos los bloques)"""
+    pages = []
+    for batch in query_database(database_id, filter=filter, sorts=sorts, properties=properties):
+        pages.extend(batch.results)
+    return pages
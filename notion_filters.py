@@ -0,0 +1,55 @@
+"""
+Filtros de Notion para hacer en el servidor un primer descarte de dispositivos
+
+El filtro de disponibilidad es un superconjunto: nunca deja fuera un
+dispositivo libre, pero puede traer alguno ocupado. Después hay que seguir
+comprobando cada dispositivo en local (check_availability).
+"""
+from notion_schema import DEVICE_FIELDS
+
+
+def _property(fields, field):
+    return fields[field][0]
+
+
+def availability_filter(start_date, end_date, tag=None, fields=DEVICE_FIELDS):
+    """
+    Filtro compuesto para los dispositivos que pueden estar libres en [inicio, fin]
+
+    Un dispositivo libre, o no tiene ubicación, o todas sus reservas acaban
+    antes del inicio o empiezan después del fin; así que al menos una cumple
+    una de las dos cosas:
+    - Location vacío
+    - o alguna fecha de fin (rollup) anterior al inicio
+    - o alguna fecha de inicio (rollup) posterior al fin
+
+    Se deja un día de margen a cada lado (on_or_before inicio / on_or_after
+    fin, en lugar de before / after) para que las fechas con hora y zona
+    horaria no dejen fuera a nadie. Con tag, además se exige Tags igual a ese valor.
+    """
+    free_before = start_date.isoformat()
+    free_after = end_date.isoformat()
+
+    availability = {
+        "or": [
+            {"property": _property(fields, "location_ids"), "relation": {"is_empty": True}},
+            {
+                "property": _property(fields, "end_dates"),
+                "rollup": {"any": {"date": {"on_or_before": free_before}}},
+            },
+            {
+                "property": _property(fields, "start_dates"),
+                "rollup": {"any": {"date": {"on_or_after": free_after}}},
+            },
+        ]
+    }
+
+    if tag is None:
+        return availability
+
+    return {
+        "and": [
+            availability,
+            {"property": _property(fields, "tag"), "select": {"equals": tag}},
+        ]
+    }
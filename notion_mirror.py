@@ -0,0 +1,181 @@
+"""Copia local (SQLite) de las bases de datos de Notion con sincronización incremental"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from notion_api import PROJECTIONS, query_database
+
+
+MIRROR_ENABLED = os.getenv("NOTION_MIRROR", "1") != "0"
+MIRROR_PATH = os.getenv(
+    "NOTION_MIRROR_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "notion_mirror.sqlite3"),
+)
+
+# Cada cuánto se descarga la base de datos completa (segundos).
+# La sincronización incremental no ve las páginas borradas o archivadas,
+# así que de vez en cuando hay que rehacer la copia entera.
+FULL_SYNC_INTERVAL = float(os.getenv("NOTION_MIRROR_FULL_SYNC", "3600"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    database_id TEXT NOT NULL,
+    page_id TEXT NOT NULL,
+    last_edited_time TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (database_id, page_id)
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    database_id TEXT PRIMARY KEY,
+    watermark TEXT,
+    full_synced_at REAL NOT NULL,
+    projection TEXT
+);
+"""
+
+
+class NotionMirror:
+    """
+    Copia local de una o varias bases de datos de Notion
+
+    sync() sólo descarga las páginas cuyo last_edited_time es posterior a la
+    última marca guardada; pages() lee de SQLite sin tocar la red.
+    """
+
+    def __init__(self, path=MIRROR_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            # Copias creadas antes de que existiera la columna projection
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(sync_state)")}
+            if "projection" not in columns:
+                conn.execute("ALTER TABLE sync_state ADD COLUMN projection TEXT")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _state(self, conn, database_id):
+        row = conn.execute(
+            "SELECT watermark, full_synced_at, projection FROM sync_state WHERE database_id = ?",
+            (database_id,),
+        ).fetchone()
+        return row if row else (None, 0.0, None)
+
+    def sync(self, database_id, full=False, depends_on=(), on_batch=None):
+        """
+        Trae de Notion los cambios de una base de datos y los guarda en la copia local
+
+        - full: descarga todo y sustituye la copia (elimina páginas borradas)
+        - depends_on: bases de datos de las que salen los rollups de ésta. Si
+          alguna página ya existente cambió en ellas, los rollups pueden haber
+          cambiado sin que cambie el last_edited_time, así que se hace una
+          sincronización completa.
+        - on_batch: función llamada con cada bloque (QueryPage) descargado
+
+        Devuelve la lista de ids de página que han cambiado.
+        """
+        for dependency in depends_on:
+            if self._sync_one(dependency, False, None)[1]:
+                full = True
+
+        return self._sync_one(database_id, full, on_batch)[0]
+
+    def _sync_one(self, database_id, full, on_batch):
+        """Sincroniza una base de datos. Devuelve (ids cambiados, hubo actualizaciones)"""
+        with self.lock:
+            with self._connect() as conn:
+                watermark, full_synced_at, stored_projection = self._state(conn, database_id)
+
+            # Las páginas guardadas sólo tienen las propiedades que se pidieron:
+            # si ahora se piden otras hay que volver a descargarlo todo
+            projection = json.dumps(PROJECTIONS.get(database_id))
+            if stored_projection is not None and stored_projection != projection:
+                full = True
+
+            if watermark is None or time.time() - full_synced_at > FULL_SYNC_INTERVAL:
+                full = True
+
+            query_filter = None
+            if not full:
+                # Notion redondea last_edited_time al minuto: usamos on_or_after
+                # y aceptamos volver a descargar alguna página repetida
+                query_filter = {
+                    "timestamp": "last_edited_time",
+                    "last_edited_time": {"on_or_after": watermark},
+                }
+
+            rows = []
+            new_watermark = None if full else watermark
+            for batch in query_database(database_id, filter=query_filter):
+                for page in batch.results:
+                    edited = page.get("last_edited_time", "")
+                    rows.append((database_id, page["id"], edited, json.dumps(page)))
+                    if new_watermark is None or edited > new_watermark:
+                        new_watermark = edited
+                if on_batch:
+                    on_batch(batch)
+
+            with self._connect() as conn:
+                if full:
+                    known = set()
+                    conn.execute("DELETE FROM pages WHERE database_id = ?", (database_id,))
+                else:
+                    known = {
+                        page_id for (page_id,) in conn.execute(
+                            "SELECT page_id FROM pages WHERE database_id = ?", (database_id,)
+                        )
+                    }
+
+                changed = [
+                    row[1] for row in rows
+                    if row[1] not in known or self._edited(conn, database_id, row[1]) != row[2]
+                ]
+                updated = any(page_id in known for page_id in changed)
+
+                conn.executemany(
+                    "INSERT OR REPLACE INTO pages (database_id, page_id, last_edited_time, data) "
+                    "VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                conn.execute(
+                    "INSERT INTO sync_state (database_id, watermark, full_synced_at, projection) "
+                    "VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(database_id) DO UPDATE SET watermark = excluded.watermark, "
+                    "projection = excluded.projection, "
+                    "full_synced_at = CASE WHEN ? THEN excluded.full_synced_at ELSE full_synced_at END",
+                    (database_id, new_watermark, time.time(), projection, full),
+                )
+
+            return changed, updated
+
+    def _edited(self, conn, database_id, page_id):
+        row = conn.execute(
+            "SELECT last_edited_time FROM pages WHERE database_id = ? AND page_id = ?",
+            (database_id, page_id),
+        ).fetchone()
+        return row[0] if row else None
+
+    def pages(self, database_id):
+        """Devuelve todas las páginas guardadas de una base de datos"""
+        with self._connect() as conn:
+            return [
+                json.loads(data) for (data,) in conn.execute(
+                    "SELECT data FROM pages WHERE database_id = ?", (database_id,)
+                )
+            ]
+
+
+_mirror = None
+
+
+def get_mirror():
+    """Devuelve la copia local compartida por todo el proceso"""
+    global _mirror
+    if _mirror is None:
+        _mirror = NotionMirror()
+    return _mirror
@@ -0,0 +1,193 @@
+"""
+Extracción de propiedades de páginas de Notion a partir de un mapeo declarativo
+
+Cada mapeo dice qué campo queremos, de qué propiedad de Notion sale y de qué
+tipo es. compile_extractor() lo convierte una sola vez en una función que
+recorre las propiedades sin try/except: cada tipo tiene su accesor, que
+comprueba la forma del JSON y devuelve INVALID si no es la esperada. Los
+fallos se cuentan por campo para poder diagnosticarlos.
+"""
+from collections import Counter
+
+
+# Marca de "la propiedad existe pero no tiene la forma esperada"
+INVALID = object()
+
+
+def _title(prop):
+    items = prop.get("title")
+    if not isinstance(items, list):
+        return INVALID
+    if not items:
+        return None
+
+    first = items[0]
+    if not isinstance(first, dict):
+        return INVALID
+    text = first.get("text")
+    if isinstance(text, dict) and isinstance(text.get("content"), str):
+        return text["content"]
+    if isinstance(first.get("plain_text"), str):
+        return first["plain_text"]
+    return INVALID
+
+
+def _select(prop):
+    option = prop.get("select")
+    if option is None:
+        return None
+    if isinstance(option, dict) and isinstance(option.get("name"), str):
+        return option["name"]
+    return INVALID
+
+
+def _relation(prop):
+    relations = prop.get("relation")
+    if not isinstance(relations, list):
+        return INVALID
+    ids = []
+    for relation in relations:
+        if not isinstance(relation, dict) or "id" not in relation:
+            return INVALID
+        ids.append(relation["id"])
+    return ids
+
+
+def _number(prop):
+    # Puede ser un campo numérico o un rollup numérico
+    if "rollup" in prop:
+        rollup = prop["rollup"]
+        if not isinstance(rollup, dict):
+            return INVALID
+        prop = rollup
+
+    number = prop.get("number")
+    if number is None or isinstance(number, (int, float)):
+        return number
+    return INVALID
+
+
+def _date(prop):
+    value = prop.get("date")
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        return value.get("start")
+    return INVALID
+
+
+def _rollup_dates(prop):
+    """
+    Fechas de un rollup de fechas: (fechas, es_lista)
+
+    - Rollup "show original" (array): una fecha (o None) por cada página relacionada
+    - Rollup calculado (earliest, latest...): una sola fecha
+    """
+    rollup = prop.get("rollup")
+    if rollup is None:
+        return None
+    if not isinstance(rollup, dict):
+        return INVALID
+
+    kind = rollup.get("type")
+    if kind == "date":
+        value = rollup.get("date")
+        if value is None:
+            return [], False
+        if isinstance(value, dict):
+            return [value.get("start")], False
+        return INVALID
+
+    if kind == "array":
+        items = rollup.get("array")
+        if not isinstance(items, list):
+            return INVALID
+        dates = []
+        for item in items:
+            value = item.get("date") if isinstance(item, dict) and item.get("type") == "date" else None
+            dates.append(value.get("start") if isinstance(value, dict) else None)
+        return dates, True
+
+    return INVALID
+
+
+# Accesor y valor por defecto de cada tipo
+ACCESSORS = {
+    "title": (_title, None),
+    "select": (_select, None),
+    "relation": (_relation, ()),
+    "number": (_number, None),
+    "date": (_date, None),
+    "rollup_dates": (_rollup_dates, ((), False)),
+}
+
+
+# Campos que usan las apps: campo -> (propiedad de Notion, tipo)
+DEVICE_FIELDS = {
+    "name": ("Name", "title"),
+    "tag": ("Tags", "select"),
+    "location_ids": ("Location", "relation"),
+    "start_dates": ("Start Date", "rollup_dates"),
+    "end_dates": ("End Date", "rollup_dates"),
+}
+
+LOCATION_FIELDS = {
+    "name": ("Name", "title"),
+    "type": ("Type", "select"),
+    "units": ("Units", "number"),
+    "start": ("Start Date", "date"),
+    "end": ("End Date", "date"),
+}
+
+
+def device_fields(location_property="Location"):
+    """Mapeo de Devices; las bases de datos de demo llaman "📍 Locations_demo" a la relación"""
+    fields = dict(DEVICE_FIELDS)
+    fields["location_ids"] = (location_property, "relation")
+    return fields
+
+
+def property_names(fields):
+    """Propiedades de Notion que usa un mapeo (o un extractor compilado), sin repetir"""
+    fields = getattr(fields, "fields", fields)
+    return list(dict.fromkeys(prop_name for prop_name, _ in fields.values()))
+
+
+def compile_extractor(fields):
+    """
+    Convierte un mapeo {campo: (propiedad, tipo)} en una función props -> {campo: valor}
+
+    La función devuelta tiene:
+    - failures: Counter con cuántas veces no se pudo leer cada campo
+    - fields: el mapeo original (para saber qué propiedades hacen falta)
+    """
+    plan = tuple(
+        (field, prop_name) + ACCESSORS[kind]
+        for field, (prop_name, kind) in fields.items()
+    )
+    failures = Counter()
+
+    def extract(props):
+        values = {}
+        for field, prop_name, accessor, default in plan:
+            prop = props.get(prop_name)
+            if prop is None:
+                values[field] = default
+                continue
+
+            value = accessor(prop)
+            if value is INVALID:
+                failures[field] += 1
+                value = default
+            elif value is None:
+                value = default
+            values[field] = value
+        return values
+
+    extract.failures = failures
+    extract.fields = dict(fields)
+    return extract
+
+
+extract_device_fields = compile_extractor(DEVICE_FIELDS)
+extract_location_fields = compile_extractor(LOCATION_FIELDS)
@@ -0,0 +1,231 @@
+"""Registros tipados de dispositivos y ubicaciones (se construyen una vez al leer de Notion)"""
+import sys
+import threading
+from dataclasses import dataclass, replace
+from datetime import date, datetime
+
+from notion_schema import extract_device_fields
+
+
+NO_NAME = "Sin nombre"
+NO_TAG = sys.intern("Sin tag")
+
+
+def parse_date(value):
+    """
+    Convierte una fecha ISO de Notion ("2025-05-01" o con hora) a date
+
+    Devuelve None si no hay fecha y lanza ValueError si no se puede leer.
+    """
+    if not value:
+        return None
+    return datetime.fromisoformat(value).date()
+
+
+@dataclass(slots=True, frozen=True)
+class Booking:
+    """
+    Una reserva de un dispositivo: la location relacionada y sus fechas
+
+    Sin inicio ni fin significa ocupado indefinidamente (también se usa
+    cuando las fechas de Notion no se pueden leer).
+    """
+    location_id: str | None
+    start: date | None
+    end: date | None
+
+
+@dataclass(slots=True)
+class Device:
+    """Un dispositivo de la base de datos Devices"""
+    id: str
+    name: str
+    tag: str
+    location_ids: tuple
+    bookings: tuple
+
+    @property
+    def locations_count(self):
+        return len(self.location_ids)
+
+    @property
+    def start(self):
+        """Inicio de la primera reserva"""
+        return self.bookings[0].start if self.bookings else None
+
+    @property
+    def end(self):
+        """Fin de la primera reserva"""
+        return self.bookings[0].end if self.bookings else None
+
+
+@dataclass(slots=True)
+class Location:
+    """Una ubicación de la base de datos Locations"""
+    id: str
+    name: str
+    device_count: int
+
+
+def make_booking(location_id, start, end):
+    """Crea una Booking a partir de las fechas en texto de Notion"""
+    try:
+        return Booking(location_id, parse_date(start), parse_date(end))
+    except (TypeError, ValueError):
+        # Fechas ilegibles: se trata como ocupado indefinidamente
+        return Booking(location_id, None, None)
+
+
+def with_location(device, location_id, start, end):
+    """
+    Copia del dispositivo con una reserva más en la location indicada
+
+    Es lo que queda en Notion tras asignarlo (el PATCH añade la location a
+    la relación y conserva las reservas que ya tenía), así se puede reflejar
+    la asignación sin volver a leer el dispositivo.
+    """
+    if location_id in device.location_ids:
+        return device
+    return replace(
+        device,
+        location_ids=device.location_ids + (location_id,),
+        bookings=device.bookings + (Booking(location_id, start, end),),
+    )
+
+
+def make_device(page_id, name, tag, location_ids, bookings):
+    """Crea un Device, interna el tag (hay muy pocos distintos y se repiten mucho)"""
+    return Device(
+        id=page_id,
+        name=name or NO_NAME,
+        tag=sys.intern(tag) if tag else NO_TAG,
+        location_ids=tuple(location_ids),
+        bookings=tuple(bookings),
+    )
+
+
+def pair_bookings(location_ids, start_dates, end_dates, aligned):
+    """
+    Empareja inicio y fin de cada reserva según la location a la que pertenecen
+
+    Los rollups "show original" siguen el orden de la relación, así que el
+    elemento i de cada array es la reserva de la location i. Una location sin
+    fechas queda como reserva sin inicio ni fin (ocupado indefinidamente).
+    """
+    if aligned:
+        count = max(len(location_ids), len(start_dates), len(end_dates))
+    else:
+        # Rollup calculado: sólo hay una reserva, no se puede emparejar por location
+        count = 1 if (location_ids or start_dates or end_dates) else 0
+
+    bookings = []
+    for i in range(count):
+        bookings.append(make_booking(
+            location_ids[i] if i < len(location_ids) else None,
+            start_dates[i] if i < len(start_dates) else None,
+            end_dates[i] if i < len(end_dates) else None,
+        ))
+
+    return bookings
+
+
+def device_from_page(page, extract=extract_device_fields):
+    """
+    Crea un Device a partir de una página de la base de datos Devices
+
+    Name, Tags (select), Location y los rollups Start Date / End Date de
+    TODAS las reservas, según el mapeo de notion_schema.
+    """
+    fields = extract(page["properties"])
+
+    start_dates, start_is_list = fields["start_dates"]
+    end_dates, end_is_list = fields["end_dates"]
+
+    bookings = pair_bookings(
+        fields["location_ids"], start_dates, end_dates, start_is_list and end_is_list
+    )
+
+    return make_device(page["id"], fields["name"], fields["tag"], fields["location_ids"], bookings)
+
+
+class DeviceCatalog:
+    """
+    Dispositivos indexados por id de página y por nombre
+
+    Se construye una vez por cada descarga de datos. Las selecciones y
+    asignaciones trabajan con ids; el índice por nombre sirve para detectar
+    dispositivos con el mismo nombre (que antes se confundían entre sí).
+    """
+
+    def __init__(self, devices):
+        self.devices = list(devices)
+        self.by_id = {}
+        self.ids_by_name = {}
+        for device in self.devices:
+            self.by_id[device.id] = device
+            self.ids_by_name.setdefault(device.name, []).append(device.id)
+        self.positions = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __iter__(self):
+        return iter(self.devices)
+
+    def __contains__(self, device_id):
+        return device_id in self.by_id
+
+    def get(self, device_id):
+        return self.by_id.get(device_id)
+
+    def resolve(self, device_ids):
+        """Devuelve (dispositivos encontrados, ids que no están en el catálogo)"""
+        found = []
+        missing = []
+        for device_id in device_ids:
+            device = self.by_id.get(device_id)
+            if device is None:
+                missing.append(device_id)
+            else:
+                found.append(device)
+        return found, missing
+
+    def update(self, devices):
+        """
+        Sustituye por su nueva versión los dispositivos que ya están en el catálogo
+
+        Los que no están se ignoran. Devuelve cuántos han cambiado.
+        """
+        changed = 0
+        with self.lock:
+            for device in devices:
+                current = self.by_id.get(device.id)
+                if current is None or current == device:
+                    continue
+
+                if self.positions is None:
+                    self.positions = {item.id: i for i, item in enumerate(self.devices)}
+                self.devices[self.positions[device.id]] = device
+                self.by_id[device.id] = device
+
+                if current.name != device.name:
+                    self.ids_by_name[current.name].remove(device.id)
+                    if not self.ids_by_name[current.name]:
+                        del self.ids_by_name[current.name]
+                    self.ids_by_name.setdefault(device.name, []).append(device.id)
+                changed += 1
+        return changed
+
+    def duplicate_names(self):
+        """Nombres que comparten varios dispositivos: {nombre: [ids]}"""
+        return {name: ids for name, ids in self.ids_by_name.items() if len(ids) > 1}
+
+    def is_duplicate(self, device):
+        return len(self.ids_by_name.get(device.name, ())) > 1
+
+    def display_name(self, device):
+        """Nombre para mostrar; si está repetido se añade el inicio del id para distinguirlo"""
+        if self.is_duplicate(device):
+            return f"{device.name} · {device.id[:8]}"
+        return device.name
@@ -0,0 +1,71 @@
+"""Selección de dispositivos: conjunto ordenado de ids de página"""
+
+
+class SelectionModel:
+    """
+    Dispositivos seleccionados, guardados por id de página
+
+    Es un conjunto que recuerda el orden en que se seleccionaron (un dict sin
+    valores), así que comprobar, añadir o quitar un id es O(1) y la lista, el
+    resumen y la asignación ven los dispositivos en el mismo orden. Al usar
+    ids, dos dispositivos con el mismo nombre no se confunden.
+    """
+
+    def __init__(self, device_ids=()):
+        self._ids = dict.fromkeys(device_ids)
+
+    def __contains__(self, device_id):
+        return device_id in self._ids
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __bool__(self):
+        return bool(self._ids)
+
+    def __repr__(self):
+        return f"SelectionModel({list(self._ids)!r})"
+
+    def ids(self):
+        """Lista de ids en orden de selección"""
+        return list(self._ids)
+
+    def add(self, device_id):
+        self._ids[device_id] = None
+
+    def discard(self, device_id):
+        self._ids.pop(device_id, None)
+
+    def set(self, device_id, selected):
+        """Marca o desmarca un dispositivo. Devuelve True si ha cambiado"""
+        if selected == (device_id in self._ids):
+            return False
+        if selected:
+            self.add(device_id)
+        else:
+            self.discard(device_id)
+        return True
+
+    def toggle(self, device_id):
+        self.set(device_id, device_id not in self._ids)
+
+    def select_all(self, device_ids):
+        """Añade todos los ids (p. ej. los del filtro actual) al final de la selección"""
+        for device_id in device_ids:
+            self.add(device_id)
+
+    def clear(self, device_ids=None):
+        """Quita los ids indicados, o toda la selección si no se indica ninguno"""
+        if device_ids is None:
+            self._ids.clear()
+            return
+        for device_id in device_ids:
+            self.discard(device_id)
+
+    def toggle_all(self, device_ids):
+        """Invierte la selección de cada uno de los ids"""
+        for device_id in list(device_ids):
+            self.toggle(device_id)
@@ -0,0 +1,245 @@
+"""
+Trazas por ejecución (rerun) de Streamlit: cuánto tarda cada fase
+
+Cada ejecución del script, o de un fragmento, es una traza con la sesión, el
+widget que la provocó y la duración de cada fase (span). Al terminar se
+añade como una línea JSON a TRACE_PATH. Un span cuesta dos perf_counter(),
+así que se puede dejar activado en producción.
+
+    begin_run("app")
+    with span("availability"):
+        ...
+    end_run()
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date, datetime, timezone
+from functools import wraps
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+
+TRACING_ENABLED = os.getenv("NOTION_TRACING", "1") != "0"
+TRACE_PATH = os.getenv(
+    "NOTION_TRACE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "traces.jsonl"),
+)
+# Al pasar de este tamaño el fichero se renombra a .1 y se empieza otro
+TRACE_MAX_BYTES = int(os.getenv("NOTION_TRACE_MAX_BYTES", str(5 * 1024 * 1024)))
+# Sesiones de las que se guarda estado (las que llevan más tiempo sin ejecutar se olvidan)
+TRACE_MAX_SESSIONS = int(os.getenv("NOTION_TRACE_MAX_SESSIONS", "500"))
+
+# Tipos de valores de widgets que se comparan para saber qué provocó la ejecución
+_SIMPLE_TYPES = (bool, int, float, str, date, type(None))
+
+_current = ContextVar("trace", default=None)
+_open = OrderedDict()        # sesión -> traza sin terminar (st.rerun / st.stop cortan el script)
+_snapshots = OrderedDict()   # sesión -> (valores de los widgets al final de la última ejecución,
+                             #           claves que la provocaron pasando a True)
+_lock = threading.Lock()
+
+
+class Trace:
+    """Una ejecución: fases (nombre -> [inicio, duración total, veces]) y datos de contexto"""
+
+    def __init__(self, name, session_id, trigger):
+        self.name = name
+        self.session_id = session_id
+        self.trigger = trigger
+        self.started = time.perf_counter()
+        self.timestamp = datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+        self.spans = {}
+
+    def add(self, name, duration, start=None):
+        if start is None:
+            start = time.perf_counter() - duration
+        entry = self.spans.get(name)
+        if entry is None:
+            self.spans[name] = [start - self.started, duration, 1]
+        else:
+            entry[1] += duration
+            entry[2] += 1
+
+    def to_record(self, status):
+        return {
+            "ts": self.timestamp,
+            "session": self.session_id,
+            "name": self.name,
+            "trigger": self.trigger,
+            "status": status,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "spans": [
+                {"name": name, "start_ms": round(start * 1000, 2),
+                 "duration_ms": round(duration * 1000, 2), "count": count}
+                for name, (start, duration, count) in self.spans.items()
+            ],
+        }
+
+
+def _session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
+
+
+def is_fragment_run():
+    """Indica si la ejecución actual es sólo de uno o varios fragmentos"""
+    ctx = get_script_run_ctx()
+    return bool(ctx and ctx.fragment_ids_this_run)
+
+
+def _widget_values():
+    values = {}
+    for key, value in st.session_state.items():
+        if isinstance(key, str) and not key.startswith("_") and isinstance(value, _SIMPLE_TYPES):
+            values[key] = value
+    return values
+
+
+def _detect_trigger(session_id):
+    """
+    Claves cuyo valor ha cambiado desde el final de la ejecución anterior
+
+    Los botones sólo valen True en la ejecución que provocan: si una clave
+    que provocó la ejecución anterior pasando a True vuelve a False, se
+    toma como un botón que se ha soltado y no se cuenta.
+    """
+    snapshot = _snapshots.get(session_id)
+    if snapshot is None:
+        return ["(inicio)"]
+    previous, pressed = snapshot
+    changed = []
+    for key, value in _widget_values().items():
+        if key in previous:
+            if previous[key] != value and not (key in pressed and value is False):
+                changed.append(key)
+        elif value is True:
+            # Un botón (o checkbox) que aparece ya activado
+            changed.append(key)
+    return sorted(changed)
+
+
+def _remember(store, session_id, value):
+    """
+    Guarda el estado de la sesión en _open o _snapshots, como la más reciente
+
+    Streamlit no avisa de que una sesión se ha cerrado, así que se acotan a
+    TRACE_MAX_SESSIONS y se olvidan las que llevan más tiempo sin ejecutar.
+    """
+    with _lock:
+        store[session_id] = value
+        store.move_to_end(session_id)
+        while len(store) > TRACE_MAX_SESSIONS:
+            store.popitem(last=False)
+
+
+def _forget(store, session_id):
+    with _lock:
+        return store.pop(session_id, None)
+
+
+def _write(record):
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    with _lock:
+        os.makedirs(os.path.dirname(TRACE_PATH) or ".", exist_ok=True)
+        try:
+            if os.path.getsize(TRACE_PATH) > TRACE_MAX_BYTES:
+                os.replace(TRACE_PATH, TRACE_PATH + ".1")
+        except OSError:
+            pass
+        with open(TRACE_PATH, "a", encoding="utf-8") as file:
+            file.write(line)
+
+
+def begin_run(name):
+    """Empieza la traza de una ejecución (cierra la anterior si se cortó a medias)"""
+    if not TRACING_ENABLED:
+        return
+    session_id = _session_id()
+    pending = _forget(_open, session_id)
+    if pending is not None:
+        _write(pending.to_record("interrupted"))
+
+    trace = Trace(name, session_id, _detect_trigger(session_id))
+    _remember(_open, session_id, trace)
+    _current.set(trace)
+
+
+def end_run():
+    """Termina la traza de la ejecución actual y la guarda"""
+    trace = _current.get()
+    if trace is None:
+        return
+    _current.set(None)
+    _forget(_open, trace.session_id)
+    values = _widget_values()
+    pressed = {key for key in trace.trigger if values.get(key) is True}
+    _remember(_snapshots, trace.session_id, (values, pressed))
+    _write(trace.to_record("ok"))
+
+
+@contextmanager
+def span(name):
+    """Mide una fase de la ejecución actual (no hace nada si no hay traza)"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - started, started)
+
+
+def add_time(name, seconds):
+    """Suma a una fase un tiempo medido por otro lado (p. ej. QueryPage.elapsed)"""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+def traced_fragment(name):
+    """
+    Decorador para fragmentos: si se ejecuta sólo el fragmento es una traza
+    propia; si se ejecuta con el resto del script es una fase más
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not is_fragment_run():
+                with span(name):
+                    return function(*args, **kwargs)
+
+            begin_run(name)
+            result = function(*args, **kwargs)
+            end_run()
+            return result
+        return wrapper
+    return decorator
+
+
+def read_traces(limit=200, path=TRACE_PATH):
+    """Últimas `limit` trazas guardadas (las más recientes al final)"""
+    try:
+        with open(path, "rb") as file:
+            file.seek(0, os.SEEK_END)
+            size = file.tell()
+            # Basta con leer el final del fichero
+            file.seek(max(0, size - 2 * 1024 * 1024))
+            lines = file.read().decode("utf-8", errors="replace").splitlines()
+    except OSError:
+        return []
+
+    traces = []
+    for line in lines[-limit:]:
+        try:
+            traces.append(json.loads(line))
+        except ValueError:
+            continue
+    return traces